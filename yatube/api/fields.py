@@ -0,0 +1,103 @@
+from collections import namedtuple
+
+# columns — поля модели для only(), related — для select_related(),
+# get — значение в ответе
+Field = namedtuple('Field', 'columns related get')
+
+
+class InvalidFields(Exception):
+    pass
+
+
+def image_data(post):
+    if not post.image:
+        return None
+    return {
+        'url': post.image.url,
+        'width': post.image_width,
+        'height': post.image_height,
+        'placeholder': post.image_placeholder,
+    }
+
+
+def thumbnail_data(post):
+    # заполняется prefetch_thumbnails во view
+    image = post.thumbnails.get('card') if post.image else None
+    if image is None:
+        return None
+    return {
+        'url': image.url,
+        'width': image.width,
+        'height': image.height,
+        'srcset': image.srcset,
+    }
+
+
+POST_FIELDS = {
+    'id': Field(('id',), (), lambda post: post.pk),
+    'text': Field(('text',), (), lambda post: post.text),
+    'pub_date': Field(('pub_date',), (), lambda post: post.pub_date),
+    'modified': Field(('modified',), (), lambda post: post.modified),
+    'author': Field(
+        ('author', 'author__username'), ('author',),
+        lambda post: post.author.username
+    ),
+    'group': Field(
+        ('group', 'group__slug'), ('group',),
+        lambda post: post.group.slug if post.group_id else None
+    ),
+    'comments_count': Field(
+        ('comments_count',), (), lambda post: post.comments_count
+    ),
+    'image': Field(
+        ('image', 'image_width', 'image_height', 'image_placeholder'), (),
+        image_data
+    ),
+    'thumbnail': Field(('image',), (), thumbnail_data),
+}
+POST_DEFAULT_FIELDS = (
+    'id', 'text', 'pub_date', 'author', 'group', 'comments_count', 'image'
+)
+# ключи сортировки нужны курсору, даже если их не просили
+POST_CURSOR_COLUMNS = ('id', 'pub_date')
+
+COMMENT_FIELDS = {
+    'id': Field(('id',), (), lambda comment: comment.pk),
+    'text': Field(('text',), (), lambda comment: comment.text),
+    'created': Field(('created',), (), lambda comment: comment.created),
+    'author': Field(
+        ('author', 'author__username'), ('author',),
+        lambda comment: comment.author.username
+    ),
+}
+
+
+def parse_fields(request, available, default):
+    """Поля из ?fields=a,b или default; неизвестное поле — ошибка."""
+    raw = request.GET.get('fields')
+    if raw is None:
+        return list(default)
+    names = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise InvalidFields(f'Неизвестные поля: {", ".join(unknown)}')
+    if not names:
+        raise InvalidFields('Не выбрано ни одного поля')
+    return names
+
+
+def project(queryset, available, names, always=()):
+    """Загружает из базы только столбцы выбранных полей."""
+    columns = set(always)
+    related = set()
+    for name in names:
+        columns.update(available[name].columns)
+        related.update(available[name].related)
+    queryset = queryset.only(*columns)
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset
+
+
+def serialize(obj, available, names):
+    return {name: available[name].get(obj) for name in names}
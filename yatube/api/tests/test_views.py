@@ -0,0 +1,186 @@
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+from posts.tests.utils import SMALL_GIF
+from posts.utils import POSTS_ON_PAGE
+from ..views import BATCH_LIMIT
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+class ApiViewsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, text=f'Пост {i}', group=cls.group
+            )
+            for i in range(POSTS_ON_PAGE + 2)
+        ]
+        cls.post = cls.posts[-1]
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий'
+        )
+
+    def setUp(self):
+        self.client = Client()
+
+    def test_feeds_paginated_by_cursor(self):
+        for url in (
+            reverse('api:index'),
+            reverse('api:group_posts', args=[self.group.slug]),
+            reverse('api:profile_posts', args=[self.author.username]),
+        ):
+            with self.subTest(url=url):
+                first = self.client.get(url).json()
+                self.assertEqual(len(first['results']), POSTS_ON_PAGE)
+                self.assertEqual(first['results'][0]['id'], self.post.pk)
+                self.assertEqual(first['results'][0]['author'], 'author')
+                second = self.client.get(
+                    url, {'after': first['next_cursor']}
+                ).json()
+                self.assertEqual(len(second['results']), 2)
+                self.assertEqual(second['next_cursor'], '')
+
+    def test_sparse_fields_load_only_requested_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('api:index'), {'fields': 'id,text'}
+            )
+        self.assertEqual(len(queries), 1)
+        sql = queries[0]['sql']
+        self.assertNotIn('comments_count', sql)
+        self.assertNotIn('auth_user', sql)
+        self.assertEqual(
+            set(response.json()['results'][0]), {'id', 'text'}
+        )
+
+    def test_unknown_field_rejected(self):
+        response = self.client.get(reverse('api:index'), {'fields': 'nope'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('nope', response.json()['error'])
+
+    def test_post_detail_with_comments(self):
+        response = self.client.get(
+            reverse('api:post_detail', args=[self.post.pk]),
+            {'fields': 'id,group,thumbnail'}
+        )
+        data = response.json()
+        self.assertEqual(data['group'], self.group.slug)
+        self.assertIsNone(data['thumbnail'])
+        self.assertEqual(data['comments']['results'][0]['author'], 'reader')
+        self.assertNotIn('text', data)
+
+    def test_profile_and_group(self):
+        data = self.client.get(
+            reverse('api:profile', args=[self.author.username])
+        ).json()
+        self.assertEqual(data['posts_count'], len(self.posts))
+        data = self.client.get(
+            reverse('api:group_detail', args=[self.group.slug])
+        ).json()
+        self.assertEqual(data['title'], self.group.title)
+
+    def test_not_found_is_json(self):
+        response = self.client.get(reverse('api:profile', args=['missing']))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'Не найдено'})
+
+    def test_follow_feed(self):
+        response = self.client.get(reverse('api:follow_index'))
+        self.assertEqual(response.status_code, 401)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client.force_login(self.reader)
+        data = self.client.get(
+            reverse('api:follow_index'), {'fields': 'id'}
+        ).json()
+        self.assertEqual(
+            [post['id'] for post in data['results']],
+            [post.pk for post in self.posts[::-1][:POSTS_ON_PAGE]]
+        )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostBatchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author,
+                text=f'Пост {i}',
+                group=cls.group,
+                image=SimpleUploadedFile(
+                    f'small{i}.gif', SMALL_GIF + bytes([i])
+                ),
+            )
+            for i in range(5)
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def get_batch(self, ids, **params):
+        return self.client.get(
+            reverse('api:post_batch'),
+            {'ids': ','.join(str(pk) for pk in ids), **params}
+        )
+
+    def test_fixed_number_of_queries(self):
+        for posts in (self.posts[:1], self.posts):
+            with self.subTest(count=len(posts)):
+                cache.clear()
+                # посты с авторами и группами + key-value store миниатюр
+                with self.assertNumQueries(2):
+                    response = self.get_batch([post.pk for post in posts])
+                results = response.json()['results']
+                self.assertEqual(len(results), len(posts))
+                self.assertEqual(results[0]['author'], 'author')
+                self.assertEqual(results[0]['group'], 'group')
+                self.assertIn('thumbnail', results[0])
+
+    def test_order_kept_and_missing_reported(self):
+        ids = [self.posts[2].pk, 10 ** 6, self.posts[0].pk, self.posts[2].pk]
+        data = self.get_batch(ids, fields='text').json()
+        self.assertEqual(
+            data['results'],
+            [
+                {'id': self.posts[2].pk, 'text': 'Пост 2'},
+                {'id': self.posts[0].pk, 'text': 'Пост 0'},
+            ]
+        )
+        self.assertEqual(data['missing'], [10 ** 6])
+
+    def test_invalid_batches_rejected(self):
+        too_many = ','.join(str(pk) for pk in range(1, BATCH_LIMIT + 2))
+        for ids in ('', 'a,b', too_many, '0', '1,-5', '9' * 23):
+            with self.subTest(ids=ids[:20]):
+                response = self.client.get(
+                    reverse('api:post_batch'), {'ids': ids}
+                )
+                self.assertEqual(response.status_code, 400)
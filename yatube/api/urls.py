@@ -0,0 +1,26 @@
+from django.urls import path
+
+from . import views
+
+
+app_name = 'api'
+
+urlpatterns = [
+    path('posts/', views.index, name='index'),
+    path('posts/batch/', views.post_batch, name='post_batch'),
+    path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
+    path('groups/<slug:slug>/', views.group_detail, name='group_detail'),
+    path('groups/<slug:slug>/posts/', views.group_posts, name='group_posts'),
+    path('profiles/<str:username>/', views.profile, name='profile'),
+    path(
+        'profiles/<str:username>/posts/',
+        views.profile_posts,
+        name='profile_posts'
+    ),
+    path('follow/', views.follow_index, name='follow_index'),
+]
@@ -0,0 +1,184 @@
+from functools import wraps
+
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_safe
+
+from posts.models import Group, Post
+from posts.queries import (
+    author_feed, author_queryset, get_follow_page, group_feed, index_feed
+)
+from posts.thumbnails import prefetch_thumbnails
+from posts.utils import COMMENTS_ORDERING, COMMENTS_ON_PAGE, get_cursor_page
+from .fields import (
+    COMMENT_FIELDS, POST_CURSOR_COLUMNS, POST_DEFAULT_FIELDS, POST_FIELDS,
+    InvalidFields, parse_fields, project, serialize
+)
+
+# сколько постов можно запросить одним вызовом posts/batch/
+BATCH_LIMIT = 50
+# больше не влезает в целочисленный столбец id
+MAX_ID = 2 ** 63 - 1
+
+
+def api_error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def api_view(view):
+    """Только чтение; ошибки отдаются JSON, а не HTML-страницей."""
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except Http404:
+            return api_error('Не найдено', 404)
+        except InvalidFields as error:
+            return api_error(str(error), 400)
+    return wrapper
+
+
+def page_data(page, results):
+    return {
+        'results': results,
+        'next_cursor': getattr(page, 'next_cursor', ''),
+        'previous_cursor': getattr(page, 'previous_cursor', ''),
+    }
+
+
+def serialize_posts(posts, names):
+    posts = list(posts)
+    if 'thumbnail' in names:
+        prefetch_thumbnails(posts, ['card'])
+    return [serialize(post, POST_FIELDS, names) for post in posts]
+
+
+def post_list(request, posts, page=None):
+    """Страница ленты по курсору с полями из ?fields=."""
+    names = parse_fields(request, POST_FIELDS, POST_DEFAULT_FIELDS)
+    posts = project(posts, POST_FIELDS, names, POST_CURSOR_COLUMNS)
+    if page is None:
+        page = get_cursor_page(posts, request)
+    else:
+        page = page(posts)
+    return JsonResponse(page_data(page, serialize_posts(page, names)))
+
+
+def comments_data(request, post):
+    page = get_cursor_page(
+        project(post.comments.all(), COMMENT_FIELDS, COMMENT_FIELDS),
+        request, COMMENTS_ORDERING, COMMENTS_ON_PAGE
+    )
+    return page_data(page, [
+        serialize(comment, COMMENT_FIELDS, COMMENT_FIELDS) for comment in page
+    ])
+
+
+@api_view
+def index(request):
+    posts, _ = index_feed()
+    return post_list(request, posts)
+
+
+@api_view
+def group_detail(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return JsonResponse({
+        'slug': group.slug,
+        'title': group.title,
+        'description': group.description,
+    })
+
+
+@api_view
+def group_posts(request, slug):
+    group = get_object_or_404(Group.objects.only('pk'), slug=slug)
+    posts, _ = group_feed(group)
+    return post_list(request, posts)
+
+
+@api_view
+def profile(request, username):
+    author = get_object_or_404(author_queryset(), username=username)
+    return JsonResponse({
+        'username': author.username,
+        'first_name': author.first_name,
+        'last_name': author.last_name,
+        'posts_count': author.stats.posts_count,
+        'followers_count': author.stats.followers_count,
+        'following_count': author.stats.following_count,
+    })
+
+
+@api_view
+def profile_posts(request, username):
+    author = get_object_or_404(
+        author_queryset().only('pk'), username=username
+    )
+    posts, _ = author_feed(author)
+    return post_list(request, posts)
+
+
+@api_view
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return api_error('Нужно войти', 401)
+    return post_list(
+        request, Post.objects.all(),
+        lambda posts: get_follow_page(request, posts)
+    )
+
+
+@api_view
+def post_detail(request, post_id):
+    names = parse_fields(request, POST_FIELDS, POST_DEFAULT_FIELDS)
+    post = get_object_or_404(
+        project(Post.objects.all(), POST_FIELDS, names), pk=post_id
+    )
+    data = serialize_posts([post], names)[0]
+    data['comments'] = comments_data(request, post)
+    return JsonResponse(data)
+
+
+def parse_ids(raw):
+    """Id постов из ?ids=1,2,3 без повторов, в порядке запроса."""
+    try:
+        ids = [int(value) for value in raw.split(',') if value.strip()]
+    except ValueError:
+        raise InvalidFields('ids должны быть целыми числами')
+    if any(not 1 <= pk <= MAX_ID for pk in ids):
+        raise InvalidFields(f'ids должны быть от 1 до {MAX_ID}')
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise InvalidFields('Не передано ни одного id')
+    if len(ids) > BATCH_LIMIT:
+        raise InvalidFields(f'Не больше {BATCH_LIMIT} id за запрос')
+    return ids
+
+
+@api_view
+def post_batch(request):
+    """Несколько постов по id за фиксированное число запросов: посты
+    с авторами и группами одним JOIN (число комментариев хранится в
+    самом посте) и миниатюры одной выборкой. Ненайденные id
+    перечисляются в missing."""
+    ids = parse_ids(request.GET.get('ids', ''))
+    names = parse_fields(
+        request, POST_FIELDS, POST_DEFAULT_FIELDS + ('thumbnail',)
+    )
+    if 'id' not in names:
+        # без id клиент не сопоставит посты со своим списком
+        names.insert(0, 'id')
+    found = project(Post.objects.all(), POST_FIELDS, names).in_bulk(ids)
+    posts = [found[pk] for pk in ids if pk in found]
+    return JsonResponse({
+        'results': serialize_posts(posts, names),
+        'missing': [pk for pk in ids if pk not in found],
+    })
+
+
+@api_view
+def post_comments(request, post_id):
+    post = get_object_or_404(Post.objects.only('id'), pk=post_id)
+    return JsonResponse(comments_data(request, post))
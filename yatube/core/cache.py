@@ -0,0 +1,325 @@
+import fcntl
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+STAT_NAMES = (
+    'l1_hits', 'l1_misses', 'l2_hits', 'l2_misses',
+    'evictions', 'invalidations', 'resets',
+)
+
+# L1 общий для всех потоков процесса, как у LocMemCache; ключ содержит pid,
+# чтобы форкнутые воркеры не унаследовали словарь родителя
+_stores = {}
+_stores_lock = threading.Lock()
+_missing = object()
+
+
+class LocalStore:
+    """L1: LRU-словарь процесса с ограниченным числом записей."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        # метка в журнале, по которой процесс узнаёт свои записи
+        self.token = uuid.uuid4().hex
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+        self.stats = dict.fromkeys(STAT_NAMES, 0)
+        self.journal_inode = None
+        self.journal_offset = 0
+        self.next_sync = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return _missing
+            pickled, expire_at = entry
+            if expire_at <= time.time():
+                del self.entries[key]
+                return _missing
+            self.entries.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def set(self, key, value, expire_at):
+        # как и LocMemCache, храним копию: изменения объекта после set()
+        # не должны просачиваться в кэш
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.entries[key] = (pickled, expire_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def discard(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class InvalidationJournal:
+    """Общий для воркеров файл, куда дописываются изменённые ключи.
+
+    Каждый процесс дочитывает хвост журнала и выбрасывает эти ключи из
+    своего L1. Если файл подменили при ротации, L1 очищается целиком.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def publish(self, keys, store):
+        lines = ''.join(f'{store.token} {key}\n' for key in keys)
+        # одна запись в режиме O_APPEND не перемешивается с чужими
+        with open(self.path, 'a', encoding='utf-8') as journal:
+            journal.write(lines)
+            size = journal.tell()
+        if size > self.max_bytes:
+            try:
+                os.replace(self.path, self.path + '.old')
+            except FileNotFoundError:
+                pass
+
+    def read_new(self, store):
+        """Ключи, изменённые другими процессами; None — сбросить весь L1."""
+        try:
+            stat = os.stat(self.path)
+            inode, size = stat.st_ino, stat.st_size
+        except FileNotFoundError:
+            inode, size = 0, 0
+        if store.journal_inode is None:
+            # новый процесс: его L1 пуст, старые записи не нужны
+            store.journal_inode, store.journal_offset = inode, size
+            return []
+        reset = inode != store.journal_inode or size < store.journal_offset
+        if reset:
+            store.journal_inode, store.journal_offset = inode, 0
+        keys = self.read_tail(store) if size > store.journal_offset else []
+        return None if reset else keys
+
+    def read_tail(self, store):
+        with open(self.path, 'rb') as journal:
+            journal.seek(store.journal_offset)
+            data = journal.read()
+        # недописанную последнюю строку дочитаем в следующий раз
+        data = data[:data.rfind(b'\n') + 1]
+        store.journal_offset += len(data)
+        keys = []
+        for line in data.decode('utf-8', 'replace').splitlines():
+            owner, _, key = line.partition(' ')
+            if owner != store.token:
+                keys.append(key)
+        return keys
+
+
+class TwoTierCache(BaseCache):
+    """Двухуровневый кэш для нескольких воркеров на одном хосте.
+
+    L1 — небольшой LRU в памяти процесса, L2 — общий кэш (LOCATION —
+    алиас из CACHES, например FileBasedCache). Записи идут в оба уровня,
+    а ключи изменённых записей рассылаются остальным процессам через
+    InvalidationJournal. В L2 значение лежит вместе со своим сроком
+    (expire_at, value): запись, прочитанная из L2, живёт в L1 не
+    дольше, чем в L2.
+
+    OPTIONS:
+        L1_MAX_ENTRIES — размер L1 (по умолчанию 1000);
+        L1_TIMEOUT — сколько секунд запись живёт в L1 (по умолчанию 60);
+        JOURNAL — путь к журналу инвалидаций, None — без рассылки; рядом
+            с ним лежит файл блокировки для incr (JOURNAL + '.lock');
+        JOURNAL_MAX_BYTES — размер журнала до ротации;
+        SYNC_INTERVAL — как часто дочитывать журнал, в секундах.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = location
+        self.l1_timeout = options.get('L1_TIMEOUT', 60)
+        self.sync_interval = options.get('SYNC_INTERVAL', 0.5)
+        journal = options.get('JOURNAL')
+        self.journal = journal and InvalidationJournal(
+            journal, options.get('JOURNAL_MAX_BYTES', 1024 * 1024)
+        )
+        store_key = (location, os.getpid())
+        with _stores_lock:
+            if store_key not in _stores:
+                _stores[store_key] = LocalStore(
+                    options.get('L1_MAX_ENTRIES', 1000)
+                )
+            self.local = _stores[store_key]
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    @contextmanager
+    def update_lock(self):
+        """Блокировка чтения-изменения-записи в L2: между потоками — lock
+        L1, между процессами хоста — flock на файле рядом с журналом."""
+        with self.local.lock:
+            if self.journal is None:
+                # без журнала L2 не делят несколько процессов
+                yield
+                return
+            with open(self.journal.path + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def sync(self):
+        if self.journal is None or time.time() < self.local.next_sync:
+            return
+        with self.local.lock:
+            self.local.next_sync = time.time() + self.sync_interval
+            keys = self.journal.read_new(self.local)
+            if keys is None:
+                self.local.clear()
+                self.local.stats['resets'] += 1
+            elif keys:
+                self.local.discard(keys)
+                self.local.stats['invalidations'] += len(keys)
+
+    def changed(self, keys):
+        self.local.discard(keys)
+        if self.journal is not None:
+            self.journal.publish(keys, self.local)
+
+    def local_expiry(self, backend_expiry):
+        expire_at = time.time() + self.l1_timeout
+        if backend_expiry is None:
+            return expire_at
+        return min(expire_at, backend_expiry)
+
+    def shared_timeout(self, backend_expiry):
+        """Сколько ещё секунд запись со сроком backend_expiry живёт в L2."""
+        if backend_expiry is None:
+            return None
+        return max(backend_expiry - time.time(), 0)
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        self.sync()
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.local.get(self.make_key(key, version))
+            if value is _missing:
+                missing.append(key)
+            else:
+                found[key] = value
+        stats = self.local.stats
+        stats['l1_hits'] += len(found)
+        stats['l1_misses'] += len(missing)
+        if not missing:
+            return found
+        shared_found = self.shared.get_many(missing, version=version)
+        stats['l2_hits'] += len(shared_found)
+        stats['l2_misses'] += len(missing) - len(shared_found)
+        for key, (backend_expiry, value) in shared_found.items():
+            self.local.set(
+                self.make_key(key, version), value,
+                self.local_expiry(backend_expiry)
+            )
+            found[key] = value
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        backend_expiry = self.get_backend_timeout(timeout)
+        self.shared.set_many(
+            {key: (backend_expiry, value) for key, value in data.items()},
+            self.shared_timeout(backend_expiry), version=version
+        )
+        full_keys = [self.make_key(key, version) for key in data]
+        self.changed(full_keys)
+        expire_at = self.local_expiry(backend_expiry)
+        for full_key, value in zip(full_keys, data.values()):
+            self.local.set(full_key, value, expire_at)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        backend_expiry = self.get_backend_timeout(timeout)
+        added = self.shared.add(
+            key, (backend_expiry, value),
+            self.shared_timeout(backend_expiry), version=version
+        )
+        if added:
+            self.changed([self.make_key(key, version)])
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        # срок хранится и внутри значения, поэтому запись перезаписывается
+        stored = self.shared.get(key, version=version)
+        if stored is None:
+            return False
+        self.set(key, stored[1], timeout, version)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        # чтение и запись с прежним сроком записи. У FileBasedCache нет
+        # атомарного incr, а два одновременных N + 1 потеряли бы одно
+        # изменение (на нём держится проверка поколений лент), поэтому
+        # incr сериализуются flock, см. update_lock
+        with self.update_lock():
+            stored = self.shared.get(key, version=version)
+            if stored is None:
+                raise ValueError("Key '%s' not found" % key)
+            backend_expiry, value = stored
+            value += delta
+            self.shared.set(
+                key, (backend_expiry, value),
+                self.shared_timeout(backend_expiry), version=version
+            )
+        self.changed([self.make_key(key, version)])
+        return value
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        if not keys:
+            return
+        self.shared.delete_many(keys, version=version)
+        self.changed([self.make_key(key, version) for key in keys])
+
+    def has_key(self, key, version=None):
+        return self.get(key, _missing, version) is not _missing
+
+    def clear(self):
+        self.shared.clear()
+        self.local.clear()
+        if self.journal is not None:
+            try:
+                os.replace(self.journal.path, self.journal.path + '.old')
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        """Счётчики попаданий и промахов L1/L2 этого процесса."""
+        return {
+            'pid': os.getpid(),
+            'l1_entries': len(self.local.entries),
+            'l1_max_entries': self.local.max_entries,
+            **self.local.stats,
+        }
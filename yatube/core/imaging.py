@@ -0,0 +1,207 @@
+import os
+import signal
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.apps import apps
+from django.conf import settings
+
+
+class QueueFull(Exception):
+    """В очереди уже IMAGE_QUEUE_LIMIT задач: новая не принимается."""
+
+
+class JobTimeout(Exception):
+    """Задача не уложилась в IMAGE_JOB_TIMEOUT и была прервана."""
+
+
+# пул не смог выполнить задачу: её можно повторить позже
+POOL_BUSY_ERRORS = (QueueFull, BrokenProcessPool, FuturesTimeoutError)
+
+
+def init_worker():
+    """Готовит дочерний процесс: соединения с базой и кэши родителя
+    ему не принадлежат."""
+    if not apps.ready:
+        django.setup()
+    from django.core.cache import caches
+    from django.db import connections
+    for connection in connections.all():
+        # не close(): закрытие сокета оборвало бы сессию родителя
+        connection.connection = None
+    caches._caches = threading.local()
+    # воркер не должен умирать от Ctrl+C в терминале с runserver
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def raise_timeout(signum, frame):
+    raise JobTimeout('Задача прервана по тайм-ауту')
+
+
+def execute(fn, args, timeout, submitted):
+    """Выполняется в дочернем процессе: сама задача, её тайм-аут и
+    замеры времени."""
+    started = time.time()
+    if timeout:
+        signal.signal(signal.SIGALRM, raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        result = fn(*args)
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    return result, started - submitted, time.time() - started
+
+
+class Timing:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'avg': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+        }
+
+
+class ImagePool:
+    """Пул процессов для работы с Pillow вне процесса веб-воркера.
+
+    Декодирование картинок держит GIL, поэтому миниатюры и нормализация
+    загрузок выполняются в IMAGE_WORKERS дочерних процессах. Очередь
+    ограничена IMAGE_QUEUE_LIMIT: лишняя задача сразу получает QueueFull,
+    а не копится в памяти. Каждая задача прерывается через
+    IMAGE_JOB_TIMEOUT секунд. При IMAGE_WORKERS = 0 задачи выполняются
+    сразу, в вызывающем потоке.
+
+    workers переопределяет IMAGE_WORKERS для отдельного пула, например
+    в management-команде.
+    """
+
+    def __init__(self, workers=None):
+        self._workers = workers
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pid = None
+        self.in_flight = 0
+        self.counters = dict.fromkeys(
+            ('submitted', 'completed', 'failed', 'timeouts', 'rejected'), 0
+        )
+        self.queue_latency = Timing()
+        self.processing = Timing()
+
+    @property
+    def workers(self):
+        if self._workers is None:
+            return settings.IMAGE_WORKERS
+        return self._workers
+
+    def get_executor(self):
+        # форкнутый веб-воркер не может пользоваться пулом родителя
+        if self.executor is None or self.pid != os.getpid():
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=init_worker
+            )
+            self.pid = os.getpid()
+            self.in_flight = 0
+        return self.executor
+
+    def submit(self, fn, *args, timeout=None):
+        """Ставит fn(*args) в очередь и возвращает Future с результатом.
+
+        fn и аргументы должны сериализоваться pickle.
+        """
+        timeout = timeout or settings.IMAGE_JOB_TIMEOUT
+        if not self.workers:
+            return self.run_inline(fn, args)
+        with self.lock:
+            if self.in_flight >= settings.IMAGE_QUEUE_LIMIT:
+                self.counters['rejected'] += 1
+                raise QueueFull()
+            executor = self.get_executor()
+            try:
+                future = executor.submit(
+                    execute, fn, args, timeout, time.time()
+                )
+            except BrokenProcessPool:
+                # дочерний процесс упал: следующая задача создаст новый пул
+                self.executor = None
+                raise
+            self.in_flight += 1
+            self.counters['submitted'] += 1
+        outer = Future()
+        future.add_done_callback(lambda done: self.finish(done, outer))
+        return outer
+
+    def run_inline(self, fn, args):
+        future = Future()
+        started = time.time()
+        try:
+            future.set_result(fn(*args))
+        except Exception as error:
+            self.counters['failed'] += 1
+            future.set_exception(error)
+        else:
+            self.counters['completed'] += 1
+            self.processing.add(time.time() - started)
+        return future
+
+    def finish(self, done, outer):
+        with self.lock:
+            self.in_flight -= 1
+            error = done.exception()
+            if error is None:
+                result, waited, spent = done.result()
+                self.counters['completed'] += 1
+                self.queue_latency.add(waited)
+                self.processing.add(spent)
+            elif isinstance(error, JobTimeout):
+                self.counters['timeouts'] += 1
+            else:
+                self.counters['failed'] += 1
+                if isinstance(error, BrokenProcessPool):
+                    self.executor = None
+        if error is None:
+            outer.set_result(result)
+        else:
+            outer.set_exception(error)
+
+    def run(self, fn, *args, timeout=None):
+        """Выполняет fn(*args) в пуле и ждёт результат."""
+        timeout = timeout or settings.IMAGE_JOB_TIMEOUT
+        future = self.submit(fn, *args, timeout=timeout)
+        # запас на очередь: сама задача прервётся по тайм-ауту в воркере
+        return future.result(timeout * 2)
+
+    def stats(self):
+        return {
+            'pid': os.getpid(),
+            'workers': self.workers,
+            'queue_limit': settings.IMAGE_QUEUE_LIMIT,
+            'in_flight': self.in_flight,
+            **self.counters,
+            'queue_latency': self.queue_latency.as_dict(),
+            'processing': self.processing.as_dict(),
+        }
+
+    def shutdown(self):
+        """Дожидается задач и останавливает дочерние процессы."""
+        if self.executor is not None and self.pid == os.getpid():
+            self.executor.shutdown()
+        self.executor = None
+
+
+image_pool = ImagePool()
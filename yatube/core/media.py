@@ -0,0 +1,139 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# имена по хэшу содержимого (posts/ab/…) и миниатюры sorl (cache/…)
+IMMUTABLE_RE = re.compile(r'^(posts/[0-9a-f]{2}/[0-9a-f]{64}|cache/)')
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+class RangeFile:
+    """Файл, из которого читается не больше length байт с offset."""
+
+    def __init__(self, file_, offset, length):
+        self.file = file_
+        self.file.seek(offset)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def is_public(path):
+    """Отдаются только каталоги из MEDIA_PUBLIC_DIRS."""
+    return path.split('/', 1)[0] in settings.MEDIA_PUBLIC_DIRS
+
+
+def get_etag(stat):
+    # как у nginx: время изменения и размер, без чтения файла
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def cache_control(path):
+    if IMMUTABLE_RE.match(path):
+        return f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return f'public, max-age={settings.MEDIA_MAX_AGE}'
+
+
+def parse_range(header, size):
+    """(начало, длина) для одного диапазона bytes=…; None — отдать весь
+    файл; ValueError — диапазон вне файла (ответ 416)."""
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or not any(match.groups()):
+        # несколько диапазонов не поддерживаем: отдаём файл целиком
+        return None
+    start, end = match.groups()
+    if not start:
+        length = min(int(end), size)
+        if not length:
+            raise ValueError(header)
+        return size - length, length
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end - start + 1
+
+
+def range_applies(request, etag, last_modified):
+    """If-Range: диапазон действует, только если файл не менялся."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def guess_type(full_path):
+    content_type, encoding = mimetypes.guess_type(full_path)
+    return content_type or 'application/octet-stream', encoding
+
+
+def accel_response(path, full_path):
+    """Передача файла фронт-прокси: Django только проверил доступ, а
+    длину, диапазоны и условные запросы обслужит прокси."""
+    response = HttpResponse(content_type=guess_type(full_path)[0])
+    if settings.MEDIA_SERVE_BACKEND == 'accel':
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + path
+    else:
+        response['X-Sendfile'] = full_path
+    return response
+
+
+def file_response(request, full_path, stat):
+    """FileResponse с ETag, Last-Modified и одним диапазоном Range."""
+    etag = get_etag(stat)
+    last_modified = int(stat.st_mtime)
+    content_type, encoding = guess_type(full_path)
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and range_applies(
+        request, etag, last_modified
+    ):
+        try:
+            byte_range = parse_range(request.META['HTTP_RANGE'], stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+    file_ = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file_, content_type=content_type)
+        response['Content-Length'] = stat.st_size
+    else:
+        start, length = byte_range
+        response = FileResponse(
+            RangeFile(file_, start, length), content_type=content_type,
+            status=206
+        )
+        response['Content-Length'] = length
+        response['Content-Range'] = (
+            f'bytes {start}-{start + length - 1}/{stat.st_size}'
+        )
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def stat_media(full_path):
+    """os.stat обычного файла или None, если отдавать нечего."""
+    try:
+        stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return stat if os.path.isfile(full_path) else None
@@ -0,0 +1,29 @@
+from .personal import fill
+
+
+class PersonalFragmentsMiddleware:
+    """Заполняет персональные вставки HTML-страниц (см. core.personal).
+
+    Тело страницы с маркерами одинаково для всех посетителей и может
+    храниться в общем кэше; имя пользователя, кнопки и формы
+    подставляются здесь, на каждом ответе.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or not response.get('Content-Type', '').startswith('text/html')
+        ):
+            return response
+        content = response.content.decode(response.charset)
+        filled = fill(content, request, request.user)
+        if filled is not content:
+            response.content = filled
+            if response.has_header('Content-Length'):
+                response['Content-Length'] = len(response.content)
+        return response
@@ -0,0 +1,57 @@
+import base64
+import json
+import re
+
+from django.template.loader import render_to_string
+
+MARKER_PREFIX = '<!--personal:'
+MARKER_RE = re.compile(r'<!--personal:(\w+):([\w=-]*)-->')
+
+fragments = {}
+
+
+def register(name, template_name):
+    """Регистрирует персональную вставку name.
+
+    Декорируемая функция получает пользователя и аргументы из маркера и
+    возвращает контекст шаблона template_name.
+    """
+    def decorator(get_context):
+        fragments[name] = (template_name, get_context)
+        return get_context
+    return decorator
+
+
+def make_marker(name, **kwargs):
+    """Маркер вставки в общем для всех теле страницы."""
+    if name not in fragments:
+        raise ValueError(f'Неизвестная персональная вставка: {name}')
+    payload = base64.urlsafe_b64encode(
+        json.dumps(kwargs, sort_keys=True).encode()
+    ).decode()
+    return f'{MARKER_PREFIX}{name}:{payload}-->'
+
+
+def render_fragment(request, user, name, payload):
+    template_name, get_context = fragments[name]
+    kwargs = json.loads(base64.urlsafe_b64decode(payload))
+    context = get_context(user, **kwargs)
+    # явный user важнее контекст-процессора: так вставку можно
+    # отрисовать и для анонима, и для пользователя запроса
+    context['user'] = user
+    return render_to_string(template_name, context, request)
+
+
+def fill(content, request, user):
+    """Подставляет вставки для пользователя user вместо маркеров."""
+    if MARKER_PREFIX not in content:
+        return content
+    return MARKER_RE.sub(
+        lambda match: render_fragment(request, user, *match.groups()),
+        content
+    )
+
+
+@register('header_user', 'includes/header_user.html')
+def header_user(user, view_name=None):
+    return {'view_name': view_name}
@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from ..cache import LocalStore, TwoTierCache
+
+
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.journal_dir, ignore_errors=True)
+        caches['shared'].clear()
+        self.worker = self.make_worker()
+        self.another_worker = self.make_worker()
+
+    def make_worker(self, max_entries=100):
+        """Кэш так, как его видит отдельный процесс со своим L1."""
+        worker = TwoTierCache('shared', {'OPTIONS': {
+            'JOURNAL': os.path.join(self.journal_dir, 'journal.log'),
+            'SYNC_INTERVAL': 0,
+        }})
+        worker.local = LocalStore(max_entries)
+        return worker
+
+    def test_second_read_served_from_l1(self):
+        self.worker.set('key', 'value')
+        self.assertEqual(self.another_worker.get('key'), 'value')
+        self.assertEqual(self.another_worker.get('key'), 'value')
+        stats = self.another_worker.stats()
+        self.assertEqual(stats['l1_hits'], 1)
+        self.assertEqual(stats['l2_hits'], 1)
+        self.assertEqual(stats['l1_misses'], 1)
+
+    def test_invalidation_reaches_other_workers(self):
+        self.worker.set('key', 'old')
+        self.assertEqual(self.another_worker.get('key'), 'old')
+        self.worker.set('key', 'new')
+        self.assertEqual(self.another_worker.get('key'), 'new')
+        self.worker.delete('key')
+        self.assertIsNone(self.another_worker.get('key'))
+        self.worker.set('counter', 1)
+        self.assertEqual(self.another_worker.get('counter'), 1)
+        self.worker.incr('counter')
+        self.assertEqual(self.another_worker.get('counter'), 2)
+
+    def test_l1_entry_expires_with_l2(self):
+        self.worker.set('key', 'value', timeout=5)
+        self.assertEqual(self.another_worker.get('key'), 'value')
+        _, expire_at = self.another_worker.local.entries[
+            self.another_worker.make_key('key')
+        ]
+        self.assertLessEqual(expire_at, time.time() + 5)
+        self.worker.set('counter', 1, timeout=5)
+        self.worker.incr('counter')
+        self.another_worker.get('counter')
+        _, expire_at = self.another_worker.local.entries[
+            self.another_worker.make_key('counter')
+        ]
+        self.assertLessEqual(expire_at, time.time() + 5)
+
+    def test_concurrent_incr_not_lost(self):
+        self.worker.set('counter', 0)
+        # caches свой у каждого потока, поэтому подменяется метод класса
+        backend = type(caches['shared'])
+        get = backend.get
+
+        def slow_get(*args, **kwargs):
+            # между чтением и записью успевает вклиниться другой поток
+            value = get(*args, **kwargs)
+            time.sleep(0.001)
+            return value
+
+        def bump(worker):
+            for _ in range(20):
+                worker.incr('counter')
+
+        threads = [
+            threading.Thread(target=bump, args=(worker,))
+            for worker in (self.worker, self.another_worker) * 2
+        ]
+        with mock.patch.object(backend, 'get', slow_get):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(self.worker.get('counter'), 80)
+
+    def test_clear_resets_other_workers(self):
+        self.worker.set('key', 'value')
+        self.another_worker.get('key')
+        self.worker.clear()
+        self.assertIsNone(self.another_worker.get('key'))
+        self.assertEqual(self.another_worker.stats()['resets'], 1)
+
+    def test_l1_is_bounded_lru(self):
+        worker = self.make_worker(max_entries=2)
+        worker.set_many({'a': 1, 'b': 2})
+        worker.get('a')
+        worker.set('c', 3)
+        self.assertEqual(
+            list(worker.local.entries),
+            [worker.make_key('a'), worker.make_key('c')]
+        )
+        self.assertEqual(worker.stats()['evictions'], 1)
+        self.assertEqual(worker.get('b'), 2)
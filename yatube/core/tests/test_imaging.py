@@ -0,0 +1,41 @@
+import time
+
+from django.test import SimpleTestCase, override_settings
+
+from ..imaging import ImagePool, JobTimeout, QueueFull
+
+
+@override_settings(IMAGE_WORKERS=1, IMAGE_QUEUE_LIMIT=1, IMAGE_JOB_TIMEOUT=5)
+class ImagePoolTests(SimpleTestCase):
+    def setUp(self):
+        self.pool = ImagePool()
+
+    def tearDown(self):
+        if self.pool.executor is not None:
+            self.pool.executor.shutdown()
+
+    def test_runs_in_other_process_with_metrics(self):
+        self.assertEqual(self.pool.run(abs, -3), 3)
+        stats = self.pool.stats()
+        self.assertEqual(stats['completed'], 1)
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertEqual(stats['queue_latency']['count'], 1)
+        self.assertEqual(stats['processing']['count'], 1)
+
+    def test_queue_limit(self):
+        future = self.pool.submit(time.sleep, 0.3)
+        with self.assertRaises(QueueFull):
+            self.pool.submit(abs, -1)
+        future.result()
+        self.assertEqual(self.pool.stats()['rejected'], 1)
+        self.assertEqual(self.pool.run(abs, -1), 1)
+
+    def test_job_timeout(self):
+        with self.assertRaises(JobTimeout):
+            self.pool.run(time.sleep, 5, timeout=0.2)
+        self.assertEqual(self.pool.stats()['timeouts'], 1)
+
+    @override_settings(IMAGE_WORKERS=0)
+    def test_inline_without_workers(self):
+        self.assertEqual(self.pool.run(abs, -2), 2)
+        self.assertIsNone(self.pool.executor)
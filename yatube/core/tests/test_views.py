@@ -1,5 +1,10 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 
 from posts.models import Post
@@ -24,3 +29,75 @@ class CoreViewsTests(TestCase):
                 'post_id': non_existent_id})
         )
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+HASHED_PATH = 'posts/ab/' + 'ab' * 32 + '.jpg'
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, MEDIA_SERVE_BACKEND='django')
+class ServeMediaTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(TEMP_MEDIA_ROOT, 'posts', 'ab'))
+        for path in (HASHED_PATH, 'posts/old.jpg', 'private.txt'):
+            with open(os.path.join(TEMP_MEDIA_ROOT, path), 'wb') as file_:
+                file_.write(bytes(range(100)))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def get(self, path, **headers):
+        return self.client.get(
+            reverse('media', kwargs={'path': path}), **headers
+        )
+
+    def test_full_file_with_validators(self):
+        response = self.get(HASHED_PATH)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            b''.join(response.streaming_content), bytes(range(100))
+        )
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertNotIn(
+            'immutable', self.get('posts/old.jpg')['Cache-Control']
+        )
+        response = self.get(HASHED_PATH, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_range(self):
+        response = self.get(HASHED_PATH, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(
+            b''.join(response.streaming_content), bytes(range(10, 20))
+        )
+        response = self.get(HASHED_PATH, HTTP_RANGE='bytes=-5')
+        self.assertEqual(
+            b''.join(response.streaming_content), bytes(range(95, 100))
+        )
+        response = self.get(HASHED_PATH, HTTP_RANGE='bytes=100-')
+        self.assertEqual(response.status_code, 416)
+        response = self.get(
+            HASHED_PATH, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"stale"'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_only_public_dirs(self):
+        paths = ('private.txt', 'posts/../private.txt', 'posts/none.jpg')
+        for path in paths:
+            with self.subTest(path=path):
+                self.assertEqual(self.get(path).status_code, 404)
+
+    @override_settings(MEDIA_SERVE_BACKEND='accel')
+    def test_accel_redirect(self):
+        response = self.get(HASHED_PATH)
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/protected-media/' + HASHED_PATH
+        )
+        self.assertEqual(response.content, b'')
@@ -1,4 +1,20 @@
+import posixpath
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, JsonResponse
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_safe
+
+from .imaging import image_pool
+from .media import (
+    accel_response, cache_control, file_response, get_etag, is_public,
+    stat_media
+)
 
 
 def page_not_found(request, exception):
@@ -7,3 +23,50 @@ def page_not_found(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+@staff_member_required
+def cache_stats(request):
+    """Попадания и промахи кэша в обслужившем запрос воркере."""
+    stats = getattr(cache, 'stats', None)
+    return JsonResponse(stats() if stats else {})
+
+
+@staff_member_required
+def image_stats(request):
+    """Очередь и время обработки картинок в обслужившем запрос воркере."""
+    return JsonResponse(image_pool.stats())
+
+
+@require_safe
+def serve_media(request, path):
+    """Отдаёт загруженные файлы.
+
+    В продакшене Django только проверяет доступ, а сам файл отдаёт
+    фронт-прокси (MEDIA_SERVE_BACKEND = 'accel' для nginx или
+    'sendfile' для Apache/lighttpd). Без прокси файл отдаётся через
+    FileResponse с ETag, Last-Modified и Range.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    if not is_public(path):
+        raise Http404
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    stat = stat_media(full_path)
+    if stat is None:
+        raise Http404
+    if settings.MEDIA_SERVE_BACKEND in ('accel', 'sendfile'):
+        response = accel_response(path, full_path)
+    else:
+        etag = get_etag(stat)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=int(stat.st_mtime)
+        )
+        if response is None:
+            response = file_response(request, full_path, stat)
+        else:
+            response['ETag'] = etag
+    response['Cache-Control'] = cache_control(path)
+    return response
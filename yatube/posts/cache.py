@@ -0,0 +1,156 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Follow
+
+FEED_COUNT_TIMEOUT = 60
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+CARD_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+PAGE_CACHE_TIMEOUT = 60 * 60
+FOLLOWING_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def feed_name(kind, pk=None):
+    return kind if pk is None else f'{kind}:{pk}'
+
+
+def count_key(feed):
+    return f'feed_count:{feed}'
+
+
+def card_key(post, show_group_link, show_profile_link):
+    """Ключ отрисованной карточки: меняется вместе с Post.modified и с
+    полями автора и группы, которые выводятся в карточке."""
+    related = (
+        post.author.username,
+        post.author.get_full_name(),
+        post.group.slug if post.group_id else '',
+    )
+    digest = hashlib.md5('\0'.join(related).encode()).hexdigest()
+    return 'post_card:{}:{}:{}:{:d}{:d}'.format(
+        post.pk, post.modified.timestamp(), digest,
+        bool(show_group_link), bool(show_profile_link)
+    )
+
+
+def generation_key(feed):
+    return f'feed_generation:{feed}'
+
+
+def page_key(path):
+    digest = hashlib.md5(path.encode()).hexdigest()
+    return f'page:{digest}'
+
+
+def post_feeds(post):
+    """Имена лент, в которых показывается (или показывался) пост."""
+    feeds = ['index', feed_name('author', post.author_id)]
+    for group_id in {post.group_id, getattr(post, 'loaded_group_id', None)}:
+        if group_id:
+            feeds.append(feed_name('group', group_id))
+    return feeds
+
+
+def new_generation():
+    # начинаем с метки времени, а не с 1: если счётчик вытеснят из кэша,
+    # новые ключи фрагментов не совпадут со старыми
+    return time.time_ns()
+
+
+def get_generation(feed):
+    """Текущее поколение ленты: меняется при каждом изменении её данных."""
+    key = generation_key(feed)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, new_generation(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def _bump(feeds):
+    for feed in feeds:
+        key = generation_key(feed)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, new_generation(), None)
+
+
+def get_generations(feeds):
+    """Текущие поколения лент одним запросом к кэшу; None — поколение
+    вытеснено, и всё, что от него зависело, считается устаревшим."""
+    keys = {feed: generation_key(feed) for feed in feeds}
+    values = cache.get_many(keys.values())
+    return {feed: values.get(key) for feed, key in keys.items()}
+
+
+def bump_generations(feeds):
+    feeds = list(feeds)
+    _bump(feeds)
+    # ленту могли отрисовать с новым поколением, но по данным ещё не
+    # завершённой транзакции
+    transaction.on_commit(lambda: _bump(feeds))
+
+
+def get_feed_count(feed, count):
+    """Возвращает число постов ленты из кэша, считая его при промахе."""
+    key = count_key(feed)
+    total = cache.get(key)
+    if total is None:
+        total = count()
+        cache.set(key, total, FEED_COUNT_TIMEOUT)
+    return total
+
+
+def invalidate_counts(feeds):
+    cache.delete_many([count_key(feed) for feed in feeds])
+
+
+def following_key(user_id):
+    return f'following:{user_id}'
+
+
+def get_following_ids(user):
+    """Множество id авторов, на которых подписан пользователь.
+
+    Читается из базы один раз и сбрасывается сигналами Follow.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    if not hasattr(user, '_following_ids'):
+        key = following_key(user.pk)
+        following_ids = cache.get(key)
+        if following_ids is None:
+            following_ids = frozenset(
+                Follow.objects.filter(user=user).values_list(
+                    'author_id', flat=True
+                )
+            )
+            cache.set(key, following_ids, FOLLOWING_TIMEOUT)
+        user._following_ids = following_ids
+    return user._following_ids
+
+
+def invalidate_following_ids(user_id):
+    key = following_key(user_id)
+    cache.delete(key)
+    # множество могли перечитать внутри ещё не завершённой транзакции
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def get_cached_page(path):
+    """Сохранённая страница для анонимов, если ни одна из лент, по
+    которым она отрисована, с тех пор не менялась."""
+    page = cache.get(page_key(path))
+    if page is None:
+        return None
+    if get_generations(page['generations']) != page['generations']:
+        return None
+    return page
+
+
+def set_cached_page(path, page):
+    cache.set(page_key(path), page, PAGE_CACHE_TIMEOUT)
@@ -0,0 +1,105 @@
+import hashlib
+from functools import wraps
+
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .cache import feed_name, get_generation
+from .models import Group
+from .queries import author_queryset, post_queryset
+
+
+def generations_etag(request, generations):
+    """ETag страницы: поколения лент, по которым она отрисована, и тот,
+    кто её смотрит (персональные вставки у всех разные)."""
+    viewer = request.user.pk if request.user.is_authenticated else 0
+    parts = (viewer, *generations.values())
+    return hashlib.md5(
+        ':'.join(str(part) for part in parts).encode()
+    ).hexdigest()
+
+
+def make_etag(request, feeds):
+    """ETag из поколений лент feeds: считается по кэшу, без выборки
+    постов и отрисовки.
+
+    Прочитанные поколения остаются в request.page_generations: по ним
+    кэш страниц проверяет, не устарела ли сохранённая копия.
+    """
+    generations = {feed: get_generation(feed) for feed in feeds}
+    request.page_generations = generations
+    return generations_etag(request, generations)
+
+
+def mark_incomplete(request):
+    """Страница отрисована с заглушками вместо миниатюр: она не
+    получает ETag и не попадает в кэш страниц, пока миниатюры не готовы."""
+    request.page_incomplete = True
+
+
+def patch_page_cache_control(request, response):
+    """Браузер проверяет страницу при каждом показе, а общие кэши не
+    хранят страницы вошедших пользователей."""
+    patch_cache_control(response, no_cache=True)
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True)
+
+
+def get_page_object(request, queryset, **lookup):
+    """get_object_or_404, который читает объект страницы один раз за
+    запрос: он нужен и для ETag, и самому view."""
+    loaded = request.__dict__.setdefault('_page_objects', {})
+    key = (queryset.model, tuple(sorted(lookup.items())))
+    if key not in loaded:
+        loaded[key] = get_object_or_404(queryset, **lookup)
+    return loaded[key]
+
+
+def index_etag(request):
+    return make_etag(request, ['index'])
+
+
+def group_etag(request, slug):
+    group = get_page_object(request, Group.objects.all(), slug=slug)
+    return make_etag(request, [feed_name('group', group.pk)])
+
+
+def profile_etag(request, username):
+    author = get_page_object(request, author_queryset(), username=username)
+    # подписка посетителя меняет поколение followers, как и любая другая;
+    # following — подписки самого автора
+    return make_etag(request, [
+        feed_name('author', author.pk),
+        feed_name('followers', author.pk),
+        feed_name('following', author.pk),
+    ])
+
+
+def post_etag(request, post_id):
+    post = get_page_object(request, post_queryset(), pk=post_id)
+    # лента автора меняется при правке его постов и новых комментариях,
+    # лента группы — при правке самой группы
+    feeds = [feed_name('author', post.author_id)]
+    if post.group_id:
+        feeds.append(feed_name('group', post.group_id))
+    return make_etag(request, feeds)
+
+
+def conditional_page(etag_func):
+    """Отвечает 304, если у клиента актуальная копия страницы, и
+    просит браузер проверять её при каждом показе."""
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if getattr(request, 'page_incomplete', False):
+                del response['ETag']
+            patch_page_cache_control(request, response)
+            return response
+        # см. PageCacheMiddleware
+        wrapper.page_cache = True
+        return wrapper
+    return decorator
@@ -0,0 +1,42 @@
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(queryset, field):
+    """Подзапрос COUNT(*) по строкам queryset, связанным через field."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def recount(user_model, stats_model, post_model, comment_model,
+            follow_model):
+    """Пересчитывает все счётчики несколькими массовыми UPDATE.
+
+    Модели передаются явно, чтобы функцией могли пользоваться и миграции.
+    """
+    stats_model.objects.bulk_create(
+        [
+            stats_model(user_id=pk)
+            for pk in user_model.objects.filter(
+                stats__isnull=True
+            ).values_list('pk', flat=True)
+        ],
+        batch_size=1000
+    )
+    stats_model.objects.update(
+        posts_count=count_subquery(post_model.objects, 'author'),
+        followers_count=count_subquery(follow_model.objects, 'author'),
+        following_count=count_subquery(follow_model.objects, 'user'),
+    )
+    post_model.objects.update(
+        comments_count=count_subquery(comment_model.objects, 'post'),
+    )
@@ -1,13 +1,62 @@
 from django import forms
+from django.core.exceptions import ValidationError
 
+from uploads.models import Upload
+from .images import normalize_upload
 from .models import Post, Comment
 
 
 class PostForm(forms.ModelForm):
+    """Картинку можно прислать файлом или id готовой загрузки в поле
+    upload (см. uploads): тогда файл уже проверен и уменьшен."""
+
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
 
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+        self.upload = None
+
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if image and not hasattr(image, '_committed'):
+            # новый файл обрабатывается здесь, до транзакции сохранения:
+            # ожидание пула картинок не держит блокировки базы
+            image = normalize_upload(image)
+        return image
+
+    def clean(self):
+        cleaned_data = super().clean()
+        upload_id = self.data.get('upload')
+        if upload_id:
+            try:
+                self.upload = Upload.objects.get(
+                    pk=upload_id, user=self.user, status=Upload.DONE
+                )
+            except (Upload.DoesNotExist, ValidationError):
+                raise forms.ValidationError(
+                    'Загрузка картинки не найдена или ещё не завершена'
+                )
+        return cleaned_data
+
+    @property
+    def image_changed(self):
+        return self.upload is not None or 'image' in self.changed_data
+
+    def save(self, commit=True):
+        if self.upload is not None:
+            self.instance.image = self.upload.image
+            self.instance.image_width = self.upload.width
+            self.instance.image_height = self.upload.height
+            self.instance.image_placeholder = self.upload.placeholder
+        post = super().save(commit)
+        if self.upload is not None:
+            # файл теперь принадлежит посту
+            self.upload.delete()
+        return post
+
     def clean_text(self):
         data = self.cleaned_data['text']
         if data == '':
@@ -0,0 +1,224 @@
+import base64
+import io
+import logging
+import os
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from core.imaging import JobTimeout, POOL_BUSY_ERRORS, image_pool
+
+try:
+    from PIL import ImageCms
+    SRGB_PROFILE = ImageCms.createProfile('sRGB')
+except (ImportError, OSError):
+    ImageCms = None
+
+FORMATS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+}
+
+ProcessedImage = namedtuple(
+    'ProcessedImage', 'data extension width height placeholder'
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def open_image(file_):
+    """Открывает и полностью декодирует картинку допустимого формата."""
+    try:
+        image = Image.open(file_)
+        image.load()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        raise InvalidImage('Файл не является картинкой или повреждён')
+    if image.format not in FORMATS:
+        raise InvalidImage(f'Формат {image.format} не поддерживается')
+    return image
+
+
+def downscale(image, max_side):
+    """Уменьшает картинку так, чтобы большая сторона не превышала
+    max_side; возвращает True, если размер изменился."""
+    if max(image.size) <= max_side:
+        return False
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    return True
+
+
+def has_alpha(image):
+    return (
+        image.mode in ('RGBA', 'LA', 'PA')
+        or 'transparency' in image.info
+    )
+
+
+def to_srgb(image):
+    """Переводит картинку со встроенным ICC-профилем в sRGB, чтобы после
+    удаления профиля цвета не поплыли.
+
+    Профиль применяется только к цвету: прозрачность отделяется до
+    перевода и возвращается после.
+    """
+    icc_profile = image.info.get('icc_profile')
+    if not icc_profile or ImageCms is None:
+        return image
+    try:
+        profile = ImageCms.ImageCmsProfile(io.BytesIO(icc_profile))
+        color, alpha = image, None
+        if has_alpha(image):
+            color = image.convert('LA' if image.mode == 'LA' else 'RGBA')
+            alpha = color.getchannel('A')
+            color = color.convert(color.mode[:-1])
+        mode = 'RGB' if color.mode not in ('RGB', 'L') else color.mode
+        converted = ImageCms.profileToProfile(
+            color, profile, SRGB_PROFILE, outputMode=mode
+        )
+    except (ImageCms.PyCMSError, OSError, ValueError):
+        return image
+    if alpha is not None:
+        converted.putalpha(alpha)
+    return converted
+
+
+def has_metadata(image):
+    return bool(
+        image.info.get('exif') or image.info.get('icc_profile')
+        or image.getexif()
+    )
+
+
+def encode(image, image_format):
+    """Сохраняет картинку без EXIF и ICC."""
+    # PNG берёт профиль из info, даже если его не передали явно
+    image.info.pop('icc_profile', None)
+    image.info.pop('exif', None)
+    buffer = io.BytesIO()
+    options = {}
+    if image_format == 'JPEG':
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        options = {'quality': settings.POST_IMAGE_QUALITY, 'optimize': True}
+    elif image_format == 'PNG':
+        options = {'optimize': True}
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def normalize_image(image, max_side):
+    """Нормализованная копия открытой картинки или None, если менять
+    нечего: тогда исходный файл не перекодируется и качество не теряется.
+
+    Поворот из EXIF применяется к пикселям до удаления метаданных.
+    Анимированные картинки не трогаются, чтобы не потерять кадры.
+    """
+    if getattr(image, 'is_animated', False):
+        return None
+    if max(image.size) <= max_side and not has_metadata(image):
+        return None
+    image = to_srgb(ImageOps.exif_transpose(image))
+    downscale(image, max_side)
+    return image
+
+
+def make_placeholder(image):
+    """Превью со стороной POST_PLACEHOLDER_SIDE в виде data: URI: его
+    показывают, пока не загрузилась миниатюра."""
+    side = settings.POST_PLACEHOLDER_SIDE
+    preview = image.convert('RGB')
+    preview.thumbnail((side, side))
+    buffer = io.BytesIO()
+    preview.save(buffer, 'JPEG', quality=40)
+    return 'data:image/jpeg;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+def process(file_, max_side=None):
+    """Нормализует картинку (уменьшает до POST_IMAGE_MAX_SIDE, удаляет
+    EXIF и ICC) и описывает результат — всё за одно декодирование.
+
+    data в результате — None, если файл можно сохранить как есть.
+    """
+    image = open_image(file_)
+    normalized = normalize_image(
+        image, max_side or settings.POST_IMAGE_MAX_SIDE
+    )
+    final = image if normalized is None else normalized
+    width, height = final.size
+    return ProcessedImage(
+        data=None if normalized is None else encode(final, image.format),
+        extension=FORMATS[image.format],
+        width=width,
+        height=height,
+        placeholder=make_placeholder(final),
+    )
+
+
+def process_source(source, max_side=None):
+    """process() для пула картинок: путь к файлу или его байты."""
+    if isinstance(source, bytes):
+        return process(io.BytesIO(source), max_side)
+    with open(source, 'rb') as file_:
+        return process(file_, max_side)
+
+
+def prepare_image(path, max_side=None):
+    """Проверяет собранный файл загрузки и нормализует его.
+
+    В отличие от process(), data всегда содержит итоговые байты.
+    """
+    with open(path, 'rb') as source:
+        processed = process(source, max_side)
+        if processed.data is None:
+            source.seek(0)
+            processed = processed._replace(data=source.read())
+    return processed
+
+
+def image_name(filename, extension):
+    """Имя файла в upload_to Post.image с расширением по содержимому."""
+    stem = os.path.splitext(os.path.basename(filename))[0] or 'image'
+    return f'posts/{stem}.{extension}'
+
+
+def normalize_upload(file_):
+    """Обрабатывает присланный файл в пуле картинок и возвращает файл для
+    записи в хранилище; результат лежит в его атрибуте processed (None,
+    если обработать не удалось).
+
+    Ожидание пула длится до IMAGE_JOB_TIMEOUT, поэтому форма вызывает
+    это при проверке, до открытия транзакции.
+    """
+    if hasattr(file_, 'temporary_file_path'):
+        source = file_.temporary_file_path()
+    else:
+        file_.seek(0)
+        source = file_.read()
+    file_.seek(0)
+    try:
+        processed = image_pool.run(process_source, source)
+    except InvalidImage:
+        # проверка формы не пропустит такой файл, а модель сохранит как есть
+        processed = None
+    except (JobTimeout,) + POOL_BUSY_ERRORS:
+        # исходник сохранится как есть, его доделает normalize_images
+        logger.warning('Картинка %s сохранена без обработки', file_.name)
+        processed = None
+    if processed is not None and processed.data is not None:
+        stem = os.path.splitext(os.path.basename(file_.name))[0]
+        file_ = ContentFile(
+            processed.data, name=f'{stem}.{processed.extension}'
+        )
+    file_.processed = processed
+    return file_
@@ -0,0 +1,125 @@
+import json
+import os
+import time
+from concurrent.futures import wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.imaging import ImagePool
+from posts.models import Post
+from posts.thumbnails import generate_thumbnails, resolve_thumbnails
+
+COUNTERS = ('generated', 'ready', 'missing', 'failed')
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт недостающие миниатюры картинок постов в пуле процессов. '
+        'Позиция сохраняется после каждой пачки, и прерванный запуск '
+        'продолжается с неё'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Сколько постов проверять и обрабатывать за раз, '
+                 'не больше IMAGE_QUEUE_LIMIT'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Число процессов, по умолчанию IMAGE_WORKERS'
+        )
+        parser.add_argument(
+            '--throttle', type=float, default=0,
+            help='Пауза в секундах после каждой пачки, чтобы не отнимать '
+                 'процессор у живого трафика'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(
+                settings.BASE_DIR, 'backfill_thumbnails.json'
+            ),
+            help='Файл с сохранённой позицией'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать сначала, не читая сохранённую позицию'
+        )
+
+    def handle(self, *args, **options):
+        path = options['checkpoint']
+        state = self.load_checkpoint(path, options['restart'])
+        if state['last_pk']:
+            self.stdout.write(f'Продолжаем после поста {state["last_pk"]}')
+        batch_size = min(options['batch_size'], settings.IMAGE_QUEUE_LIMIT)
+        posts = Post.objects.exclude(image='').order_by('pk').only(
+            'pk', 'image'
+        )
+        pool = ImagePool(workers=options['workers'])
+        try:
+            while True:
+                # пачка по ключу, а не один iterator(): открытый курсор
+                # SQLite не дал бы воркерам писать в key-value store sorl
+                batch = list(
+                    posts.filter(pk__gt=state['last_pk'])[:batch_size]
+                )
+                if not batch:
+                    break
+                self.process_batch(pool, batch, state)
+                state['last_pk'] = batch[-1].pk
+                self.save_checkpoint(path, state)
+                if options['throttle']:
+                    time.sleep(options['throttle'])
+        finally:
+            pool.shutdown()
+        if os.path.exists(path):
+            os.remove(path)
+        self.stdout.write(
+            f'Создано миниатюр для картинок: {state["generated"]}, '
+            f'уже были: {state["ready"]}, нет файла: {state["missing"]}, '
+            f'ошибок: {state["failed"]}'
+        )
+
+    def process_batch(self, pool, batch, state):
+        images = {post.image.name: post.image for post in batch}
+        variants = list(settings.POST_THUMBNAILS)
+        # одна выборка из key-value store sorl на всю пачку
+        resolved = resolve_thumbnails(images.values(), variants)
+        todo = [
+            name for name in images
+            if not all(
+                resolved.get((name, variant)) is not None
+                and resolved[(name, variant)].complete
+                for variant in variants
+            )
+        ]
+        state['ready'] += len(images) - len(todo)
+        futures = {
+            pool.submit(generate_thumbnails, name): name for name in todo
+        }
+        wait(futures)
+        for future, name in futures.items():
+            error = future.exception()
+            if error is not None:
+                state['failed'] += 1
+                self.stderr.write(f'{name}: {error!r}')
+            elif future.result():
+                state['generated'] += 1
+            else:
+                state['missing'] += 1
+
+    def load_checkpoint(self, path, restart):
+        state = dict.fromkeys(COUNTERS, 0)
+        state['last_pk'] = 0
+        if not restart and os.path.exists(path):
+            with open(path) as checkpoint:
+                state.update(json.load(checkpoint))
+        return state
+
+    def save_checkpoint(self, path, state):
+        # через временный файл: оборванная запись не испортит позицию
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as checkpoint:
+            json.dump(state, checkpoint)
+        os.replace(temporary, path)
@@ -0,0 +1,79 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from posts.models import Group, Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Сколько времени и запросов к базе экономит ответ 304 на '
+        'страницах лент и поста по сравнению с полной отрисовкой'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Сколько раз запросить каждую страницу'
+        )
+
+    def handle(self, *args, **options):
+        self.factory = RequestFactory()
+        total_full = total_conditional = 0
+        for url in self.get_urls():
+            response = self.request(url)
+            etag = response.get('ETag')
+            if response.status_code != 200 or not etag:
+                self.stdout.write(f'{url}: нет ETag, пропущено')
+                continue
+            full, full_queries = self.measure(url, options['repeat'])
+            conditional, conditional_queries = self.measure(
+                url, options['repeat'], HTTP_IF_NONE_MATCH=etag
+            )
+            total_full += full
+            total_conditional += conditional
+            self.stdout.write(
+                f'{url}: 200 за {full * 1000:.1f} мс '
+                f'({full_queries} запросов) -> 304 за '
+                f'{conditional * 1000:.1f} мс ({conditional_queries} запросов)'
+            )
+        saved = total_full - total_conditional
+        percent = saved * 100 / total_full if total_full else 0
+        self.stdout.write(
+            f'Итого: сэкономлено {saved * 1000:.1f} мс на обход '
+            f'({percent:.0f}%)'
+        )
+
+    def get_urls(self):
+        urls = [reverse('posts:index')]
+        group = Group.objects.order_by('pk').first()
+        if group is not None:
+            urls.append(reverse('posts:group_list', args=[group.slug]))
+        author = User.objects.filter(posts__isnull=False).first()
+        if author is not None:
+            urls.append(reverse('posts:profile', args=[author.username]))
+        post = Post.objects.order_by('-pk').only('pk').first()
+        if post is not None:
+            urls.append(reverse('posts:post_detail', args=[post.pk]))
+        return urls
+
+    def request(self, url, **headers):
+        # без middleware: измеряется работа самого view
+        request = self.factory.get(url, **headers)
+        request.user = AnonymousUser()
+        match = resolve(url)
+        return match.func(request, *match.args, **match.kwargs)
+
+    def measure(self, url, repeat, **headers):
+        """Среднее время ответа и число запросов к базе на один ответ."""
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(repeat):
+                self.request(url, **headers)
+            spent = time.perf_counter() - started
+        return spent / repeat, len(queries) // repeat
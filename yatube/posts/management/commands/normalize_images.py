@@ -0,0 +1,73 @@
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+
+from posts.images import InvalidImage, image_name, process
+from posts.models import Post
+from posts.thumbnails import enqueue_thumbnails
+
+
+class Command(BaseCommand):
+    help = (
+        'Уменьшает уже загруженные картинки постов до POST_IMAGE_MAX_SIDE '
+        'и удаляет из них EXIF и ICC; заодно заполняет размеры и превью '
+        'у постов, загруженных до их появления'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-side', type=int, default=None,
+            help='Наибольшая сторона картинки, по умолчанию из настроек'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать, ничего не меняя'
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').order_by('pk')
+        storage = Post._meta.get_field('image').storage
+        changed = missing = broken = saved = described = 0
+        for post in posts.iterator():
+            name = post.image.name
+            try:
+                with storage.open(name) as source:
+                    processed = process(source, options['max_side'])
+                size = storage.size(name)
+            except FileNotFoundError:
+                missing += 1
+                continue
+            except InvalidImage:
+                broken += 1
+                continue
+            if processed.data is not None:
+                changed += 1
+                saved += size - len(processed.data)
+                if not options['dry_run']:
+                    self.replace_image(post, processed)
+            elif not post.image_placeholder:
+                described += 1
+                if not options['dry_run']:
+                    self.describe_image(post, processed)
+        self.stdout.write(
+            f'Обработано картинок: {changed}, сэкономлено байт: {saved}, '
+            f'добавлено превью: {described}, '
+            f'нет файла: {missing}, повреждено: {broken}'
+        )
+
+    def replace_image(self, post, processed):
+        post.image = post.image.storage.save(
+            image_name(post.image.name, processed.extension),
+            ContentFile(processed.data)
+        )
+        self.describe_image(post, processed, ['image', 'modified'])
+        enqueue_thumbnails(post.image.name)
+
+    def describe_image(self, post, processed, fields=()):
+        post.image_width = processed.width
+        post.image_height = processed.height
+        post.image_placeholder = processed.placeholder
+        # save(), а не update(): сигналы сбросят закэшированные ленты и
+        # отпустят старый файл вместе с его миниатюрами
+        post.save(update_fields=[
+            *fields, 'image_width', 'image_height', 'image_placeholder'
+        ])
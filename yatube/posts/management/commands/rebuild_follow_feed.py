@@ -0,0 +1,37 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import FeedEntry, Post
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает ленты подписок из таблиц Follow и Post'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько записей ленты вставлять за один запрос'
+        )
+
+    def handle(self, *args, **options):
+        rows = Post.objects.filter(
+            author__following__isnull=False
+        ).values_list('author__following__user_id', 'id', 'pub_date')
+        entries = (
+            FeedEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+            for user_id, post_id, pub_date in rows.iterator()
+        )
+        total = 0
+        with transaction.atomic():
+            FeedEntry.objects.all().delete()
+            while True:
+                batch = list(islice(entries, options['batch_size']))
+                if not batch:
+                    break
+                FeedEntry.objects.bulk_create(batch)
+                total += len(batch)
+        self.stdout.write(f'Записей в лентах подписок: {total}')
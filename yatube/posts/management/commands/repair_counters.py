@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.counters import recount
+from posts.models import Comment, Follow, Post, User, UserStats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов, комментариев и подписок'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recount(User, UserStats, Post, Comment, Follow)
+        self.stdout.write('Счётчики пересчитаны')
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.thumbnails import prefetch_thumbnails
+from posts.utils import FEED_ORDERING, POSTS_ON_PAGE
+
+
+class Command(BaseCommand):
+    help = (
+        'Сколько байт картинок экономят srcset и WebP на страницах ленты '
+        'по сравнению с одной JPEG-миниатюрой полной ширины'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pages', type=int, default=3,
+            help='Сколько первых страниц главной ленты измерить'
+        )
+        parser.add_argument(
+            '--viewport', type=int, default=360,
+            help='Ширина экрана в CSS-пикселях'
+        )
+        parser.add_argument(
+            '--dpr', type=float, default=2,
+            help='Плотность пикселей экрана'
+        )
+
+    def handle(self, *args, **options):
+        # карточка занимает всю ширину экрана телефона
+        min_width = round(options['viewport'] * options['dpr'])
+        posts = Post.objects.for_cards().order_by(*FEED_ORDERING)
+        total_before = total_after = 0
+        for number in range(options['pages']):
+            start = number * POSTS_ON_PAGE
+            page = list(posts[start:start + POSTS_ON_PAGE])
+            if not page:
+                break
+            prefetch_thumbnails(page, ['card'])
+            before = after = missing = 0
+            for post in page:
+                if not post.image:
+                    continue
+                image = post.thumbnails['card']
+                if image is None:
+                    missing += 1
+                    continue
+                before += self.file_size(image.fallback)
+                after += self.file_size(image.pick(min_width))
+            total_before += before
+            total_after += after
+            self.stdout.write(self.format_line(
+                f'Страница {number + 1}', before, after, missing
+            ))
+        self.stdout.write(
+            self.format_line('Итого', total_before, total_after)
+        )
+
+    def file_size(self, thumbnail):
+        return thumbnail.storage.size(thumbnail.name)
+
+    def format_line(self, title, before, after, missing=0):
+        saved = before - after
+        percent = saved * 100 / before if before else 0
+        line = (
+            f'{title}: {before} -> {after} байт, '
+            f'сэкономлено {saved} ({percent:.0f}%)'
+        )
+        if missing:
+            line += f', без миниатюр: {missing}'
+        return line
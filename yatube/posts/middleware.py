@@ -0,0 +1,107 @@
+import gzip
+import re
+
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+from core.personal import fill
+from .cache import get_cached_page, set_cached_page
+from .conditional import generations_etag, patch_page_cache_control
+
+ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
+# заголовки, которые пересчитываются для каждого посетителя
+SKIPPED_HEADERS = {
+    'content-length', 'content-encoding', 'vary', 'etag', 'cache-control'
+}
+
+
+class PageCacheMiddleware:
+    """Кэш целых страниц.
+
+    Кэшируются view с page_cache = True (см. conditional_page); ключ —
+    путь вместе с query string. Всё, что зависит от посетителя, вынесено
+    в персональные вставки (core.personal), поэтому одна копия годится
+    и анонимам, и вошедшим пользователям: вставки для них заполняет
+    PersonalFragmentsMiddleware. Для анонимов копия хранится уже
+    заполненной и сжатой gzip.
+
+    Вместе со страницей хранятся поколения лент, по которым её
+    отрисовали, и при чтении она отдаётся, только если ни одно из них
+    не изменилось: записи Post, Comment, Group и Follow меняют
+    поколения, и устаревшая копия не выдаётся. Страницы с заглушками
+    вместо миниатюр (см. mark_incomplete) не сохраняются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if self.should_store(request, response):
+            content = response.content.decode(response.charset)
+            set_cached_page(request.get_full_path(), {
+                'content': gzip.compress(response.content),
+                'anonymous': gzip.compress(
+                    fill(content, request, AnonymousUser()).encode(
+                        response.charset
+                    )
+                ),
+                'headers': [
+                    (header, value) for header, value in response.items()
+                    if header.lower() not in SKIPPED_HEADERS
+                ],
+                'generations': request.page_generations,
+            })
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not getattr(view_func, 'page_cache', False):
+            return None
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        page = get_cached_page(request.get_full_path())
+        if page is None:
+            return None
+        request.page_cache_hit = True
+        return self.make_response(request, page)
+
+    def should_store(self, request, response):
+        return (
+            request.method == 'GET'
+            and hasattr(request, 'page_generations')
+            and not getattr(request, 'page_cache_hit', False)
+            and not getattr(request, 'page_incomplete', False)
+            and response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            # токен CSRF допустим только внутри персональных вставок
+            and not request.META.get('CSRF_COOKIE_USED')
+        )
+
+    def make_response(self, request, page):
+        response = HttpResponse(status=200)
+        for header, value in page['headers']:
+            response[header] = value
+        response['ETag'] = '"{}"'.format(
+            generations_etag(request, page['generations'])
+        )
+        patch_page_cache_control(request, response)
+        conditional = get_conditional_response(
+            request, etag=response['ETag'], response=response
+        )
+        if conditional is not response:
+            return conditional
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if request.user.is_authenticated:
+            # вставки заполнит PersonalFragmentsMiddleware
+            response.content = gzip.decompress(page['content'])
+            return response
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if ACCEPTS_GZIP_RE.search(accept_encoding):
+            response.content = page['anonymous']
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response.content = gzip.decompress(page['anonymous'])
+        response['Content-Length'] = len(response.content)
+        return response
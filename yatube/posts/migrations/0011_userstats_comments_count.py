@@ -0,0 +1,47 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from posts.counters import recount
+
+
+def fill_counters(apps, schema_editor):
+    recount(
+        apps.get_model(*settings.AUTH_USER_MODEL.split('.')),
+        apps.get_model('posts', 'UserStats'),
+        apps.get_model('posts', 'Post'),
+        apps.get_model('posts', 'Comment'),
+        apps.get_model('posts', 'Follow'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0010_auto_20261018_0615'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Постов')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Подписок')),
+            ],
+            options={
+                'verbose_name': 'Счётчики пользователя',
+                'verbose_name_plural': 'Счётчики пользователей',
+            },
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество комментариев'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
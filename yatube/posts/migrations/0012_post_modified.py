@@ -0,0 +1,18 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_userstats_comments_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, help_text='Меняется при каждом изменении поста', verbose_name='Дата изменения'),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:33
+
+from django.db import migrations, models
+from django.db.models import Count
+import posts.storage
+
+
+def fill_references(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    StoredFile = apps.get_model('posts', 'StoredFile')
+    references = Post.objects.exclude(image='').values('image').annotate(
+        references=Count('id')
+    )
+    StoredFile.objects.bulk_create(
+        StoredFile(name=row['image'], references=row['references'])
+        for row in references
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_auto_20261018_0620'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Имя файла')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='Количество ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл картинки',
+                'verbose_name_plural': 'Файлы картинок',
+            },
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+        migrations.RunPython(fill_references, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth import get_user_model
 
 from core.models import CreatedModel
+from .storage import post_image_storage
 
 User = get_user_model()
 SIGNS_OF_TEXT = 15
@@ -16,6 +17,19 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    CARD_FIELDS = (
+        'text', 'pub_date', 'modified', 'image', 'image_width',
+        'image_height', 'image_placeholder', 'comments_count',
+        'author', 'author__username', 'author__first_name',
+        'author__last_name', 'group', 'group__slug',
+    )
+
+    def for_cards(self):
+        """Посты с автором и группой одним JOIN и только поля карточки."""
+        return self.select_related('author', 'group').only(*self.CARD_FIELDS)
+
+
 class Post(models.Model):
     text = models.TextField(
         'Текст поста',
@@ -46,17 +60,73 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=post_image_storage,
         blank=True,
     )
+    # не width_field/height_field ImageField: те открывают файл при
+    # каждом сохранении, а размеры нужны только при загрузке
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        null=True,
+        blank=True,
+        editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        null=True,
+        blank=True,
+        editable=False
+    )
+    image_placeholder = models.TextField(
+        'Превью картинки',
+        help_text='Крошечное превью в виде data: URI',
+        blank=True,
+        editable=False
+    )
+    modified = models.DateTimeField(
+        'Дата изменения',
+        help_text='Меняется при каждом изменении поста',
+        auto_now=True
+    )
+    comments_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='post_feed_idx'),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_feed_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_feed_idx'
+            ),
+        ]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
     def __str__(self):
         return self.text[:SIGNS_OF_TEXT]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # группа на момент загрузки: при переносе поста меняются обе ленты
+        instance.loaded_group_id = instance.__dict__.get('group_id')
+        # None — картинка не загружалась (only/defer), ссылки не трогаем
+        instance.loaded_image = (
+            (instance.__dict__['image'] or '')
+            if 'image' in field_names else None
+        )
+        return instance
+
 
 class Comment(CreatedModel):
     post = models.ForeignKey(
@@ -83,6 +153,14 @@ class Comment(CreatedModel):
         auto_now_add=True
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='comment_post_idx'
+            ),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -107,3 +185,74 @@ class Follow(models.Model):
                 name='unique_follow'
             ),
         ]
+
+
+class FeedEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Читатель',
+        help_text='Владелец ленты'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пост',
+        help_text='Пост автора, на которого подписан читатель'
+    )
+    pub_date = models.DateTimeField(
+        'Дата публикации',
+        help_text='Копия даты публикации поста для сортировки ленты'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_feed_entry'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feed_entry_user_idx'
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, которые обновляются при записи."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+
+class StoredFile(models.Model):
+    """Сколько постов ссылается на файл картинки.
+
+    Файлы хранятся по хэшу содержимого, один файл может принадлежать
+    нескольким постам; удаляется он вместе с последней ссылкой.
+    """
+    name = models.CharField('Имя файла', max_length=100, primary_key=True)
+    references = models.PositiveIntegerField('Количество ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,28 @@
+from core.personal import register
+from .cache import get_following_ids
+from .forms import CommentForm
+
+
+@register('switcher', 'posts/includes/switcher.html')
+def switcher(user, view_name=None):
+    return {
+        'index': view_name == 'posts:index',
+        'follow': view_name == 'posts:follow_index',
+    }
+
+
+@register('follow_button', 'posts/includes/follow_button.html')
+def follow_button(user, author_id, username):
+    return {
+        'following': author_id in get_following_ids(user),
+        'username': username,
+    }
+
+
+@register('post_actions', 'posts/includes/post_actions.html')
+def post_actions(user, post_id, author_id):
+    return {
+        'post_id': post_id,
+        'is_author': user.is_authenticated and user.pk == author_id,
+        'form': CommentForm(),
+    }
@@ -0,0 +1,45 @@
+"""Выборки лент и страниц, общие для HTML-страниц и API."""
+from .cache import feed_name, get_following_ids
+from .models import FeedEntry, Post, User
+from .utils import FOLLOW_FEED_ORDERING, get_page_number
+
+
+def author_queryset():
+    return User.objects.select_related('stats')
+
+
+def post_queryset():
+    return Post.objects.select_related('author__stats', 'group')
+
+
+def index_feed():
+    """Посты ленты и имя ленты для кэшированного счётчика."""
+    return Post.objects.all(), 'index'
+
+
+def group_feed(group):
+    return group.posts.all(), feed_name('group', group.pk)
+
+
+def author_feed(author):
+    return author.posts.all(), feed_name('author', author.pk)
+
+
+def get_follow_page(request, posts):
+    """Страница ленты подписок: записи FeedEntry по курсору и посты к
+    ним из posts одним запросом (in_bulk)."""
+    entries = FeedEntry.objects.filter(user=request.user).only(
+        'post_id', 'pub_date'
+    )
+    if not get_following_ids(request.user):
+        entries = entries.none()
+    page_obj = get_page_number(
+        entries, request, FOLLOW_FEED_ORDERING,
+        feed_name('follow', request.user.pk)
+    )
+    found = posts.in_bulk([entry.post_id for entry in page_obj])
+    page_obj.object_list = [
+        found[entry.post_id] for entry in page_obj
+        if entry.post_id in found
+    ]
+    return page_obj
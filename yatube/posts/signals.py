@@ -0,0 +1,259 @@
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+from django.utils import timezone
+from sorl.thumbnail import delete
+from sorl.thumbnail.images import ImageFile
+
+from uploads.models import Upload
+from .cache import (
+    bump_generations, feed_name, invalidate_counts, post_feeds,
+    invalidate_following_ids
+)
+from .images import normalize_upload
+from .models import (
+    Comment, FeedEntry, Follow, Group, Post, StoredFile, User, UserStats
+)
+
+FEED_BATCH_SIZE = 1000
+
+
+@receiver(pre_save, sender=Post)
+def process_post_image(sender, instance, **kwargs):
+    """Размеры и превью новой картинки сохраняются в посте. PostForm
+    обрабатывает файл ещё при проверке, вне транзакции; здесь в пул
+    уходят только файлы, сохранённые в обход формы. Уже сохранённые
+    файлы не трогаются."""
+    image = instance.image
+    if not image:
+        instance.image_width = instance.image_height = None
+        instance.image_placeholder = ''
+        return
+    if image._committed:
+        return
+    if not hasattr(image.file, 'processed'):
+        instance.image = normalize_upload(image.file)
+    processed = instance.image.file.processed
+    if processed is not None:
+        instance.image_width = processed.width
+        instance.image_height = processed.height
+        instance.image_placeholder = processed.placeholder
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if not created:
+        return
+    followers = list(Follow.objects.filter(
+        author_id=instance.author_id
+    ).values_list('user_id', flat=True))
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(
+                user_id=user_id, post=instance, pub_date=instance.pub_date
+            )
+            for user_id in followers
+        ],
+        batch_size=FEED_BATCH_SIZE
+    )
+    invalidate_counts(
+        feed_name('follow', user_id) for user_id in followers
+    )
+
+
+@receiver(post_save, sender=Follow)
+def fill_feed_on_follow(sender, instance, created, **kwargs):
+    if not created:
+        return
+    posts = Post.objects.filter(
+        author_id=instance.author_id
+    ).values_list('id', 'pub_date')
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(
+                user_id=instance.user_id, post_id=post_id, pub_date=pub_date
+            )
+            for post_id, pub_date in posts.iterator()
+        ],
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    invalidate_counts([feed_name('follow', instance.user_id)])
+
+
+@receiver(post_delete, sender=Follow)
+def clean_feed_on_unfollow(sender, instance, **kwargs):
+    FeedEntry.objects.filter(
+        user_id=instance.user_id,
+        post__author_id=instance.author_id
+    ).delete()
+    invalidate_counts([feed_name('follow', instance.user_id)])
+
+
+def change_stats(user_id, **deltas):
+    UserStats.objects.filter(user_id=user_id).update(**{
+        field: F(field) + delta for field, delta in deltas.items()
+    })
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, **kwargs):
+    if created:
+        change_stats(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    change_stats(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, **kwargs):
+    if created:
+        Post.objects.filter(pk=instance.post_id).update(
+            comments_count=F('comments_count') + 1,
+            modified=timezone.now()
+        )
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    Post.objects.filter(pk=instance.post_id).update(
+        comments_count=F('comments_count') - 1,
+        modified=timezone.now()
+    )
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, **kwargs):
+    if created:
+        change_stats(instance.author_id, followers_count=1)
+        change_stats(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    change_stats(instance.author_id, followers_count=-1)
+    change_stats(instance.user_id, following_count=-1)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_feed_counts(sender, instance, **kwargs):
+    invalidate_counts(post_feeds(instance))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def bump_post_generations(sender, instance, **kwargs):
+    bump_generations(post_feeds(instance))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_comment_generations(sender, instance, **kwargs):
+    post = Post.objects.filter(pk=instance.post_id).only(
+        'author_id', 'group_id'
+    ).first()
+    if post is not None:
+        bump_generations(post_feeds(post))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_graph(sender, instance, **kwargs):
+    invalidate_following_ids(instance.user_id)
+    # число подписчиков на странице автора и число подписок на странице
+    # подписчика
+    bump_generations([
+        feed_name('followers', instance.author_id),
+        feed_name('following', instance.user_id),
+    ])
+
+
+@receiver(post_save, sender=Group)
+# в post_delete посты уже отвязаны от группы (SET_NULL), и авторов не найти
+@receiver(pre_delete, sender=Group)
+def bump_group_generations(sender, instance, **kwargs):
+    """Адрес группы выводится не только на её странице, но и на главной,
+    в профилях авторов, писавших в неё, и на страницах их постов."""
+    author_ids = Post.objects.filter(group=instance).order_by().values_list(
+        'author_id', flat=True
+    ).distinct()
+    bump_generations([
+        'index',
+        feed_name('group', instance.pk),
+        *(feed_name('author', author_id) for author_id in author_ids),
+    ])
+
+
+def add_file_reference(name):
+    StoredFile.objects.get_or_create(name=name)
+    StoredFile.objects.filter(name=name).update(
+        references=F('references') + 1
+    )
+
+
+def drop_file_reference(name):
+    StoredFile.objects.filter(name=name).update(
+        references=F('references') - 1
+    )
+    deleted, _ = StoredFile.objects.filter(name=name, references=0).delete()
+    if deleted:
+        transaction.on_commit(lambda: delete_unreferenced_file(name))
+
+
+def delete_unreferenced_file(name):
+    """Удаляет файл и его миниатюры, если за время транзакции на него
+    никто снова не сослался (в том числе незавершённая загрузка)."""
+    if (StoredFile.objects.filter(name=name).exists()
+            or Upload.objects.filter(image=name).exists()):
+        return
+    storage = Post._meta.get_field('image').storage
+    try:
+        delete(ImageFile(name, storage))
+    except SuspiciousFileOperation:
+        # путь вне MEDIA_ROOT: такой файл хранилищу не принадлежит
+        pass
+
+
+@receiver(post_delete, sender=Upload)
+def release_upload_image(sender, instance, **kwargs):
+    """Готовый файл удалённой загрузки удаляется, если его так и не
+    прикрепили к посту."""
+    if instance.image:
+        transaction.on_commit(
+            lambda: delete_unreferenced_file(instance.image)
+        )
+
+
+@receiver(post_save, sender=Post)
+def count_image_references(sender, instance, update_fields, **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    old = getattr(instance, 'loaded_image', '')
+    new = instance.image.name or ''
+    if old is None or old == new:
+        return
+    if new:
+        add_file_reference(new)
+    if old:
+        drop_file_reference(old)
+    instance.loaded_image = new
+
+
+@receiver(post_delete, sender=Post)
+def drop_deleted_image_reference(sender, instance, **kwargs):
+    if instance.image:
+        drop_file_reference(instance.image.name)
@@ -0,0 +1,41 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, где имя файла — SHA-256 его содержимого.
+
+    Каталог (upload_to) и расширение сохраняются: posts/ab/ab…ef.jpg.
+    Одинаковые байты хранятся один раз, у дубликатов общее имя, а значит
+    и общие миниатюры. Сколько постов ссылается на файл, считает
+    StoredFile; удалять файл можно только через него.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if not self.exists(name):
+            name = self._save(name, content)
+        return name.replace('\\', '/')
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(
+            os.path.dirname(name), digest[:2], digest + extension
+        )
+
+
+post_image_storage = ContentAddressedStorage()
@@ -0,0 +1,45 @@
+from django import template
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from ..cache import card_key, CARD_CACHE_TIMEOUT
+from ..thumbnails import prefetch_thumbnails, thumbnails_ready
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_cards(posts, show_group_link=False, show_profile_link=False):
+    """Карточки постов страницы: из кэша одним get_many, недостающие
+    отрисовываются (с миниатюрами из prefetch_thumbnails) и сохраняются
+    одним set_many. Карточки с заглушкой вместо миниатюры не кэшируются."""
+    keys = {
+        card_key(post, show_group_link, show_profile_link): post
+        for post in posts
+    }
+    cached = cache.get_many(keys)
+    missing = {key: post for key, post in keys.items() if key not in cached}
+    # view мог уже найти миниатюры страницы
+    prefetch_thumbnails([
+        post for post in missing.values()
+        if 'card' not in getattr(post, 'thumbnails', {})
+    ], ['card'])
+    card_template = get_template('posts/includes/post_card.html')
+    rendered = {}
+    for key, post in missing.items():
+        rendered[key] = card_template.render({
+            'post': post,
+            'show_group_link': show_group_link,
+            'show_profile_link': show_profile_link,
+        })
+    ready = {
+        key: card for key, card in rendered.items()
+        if thumbnails_ready([missing[key]], 'card')
+    }
+    if ready:
+        cache.set_many(ready, CARD_CACHE_TIMEOUT)
+    return [
+        mark_safe(cached[key] if key in cached else rendered[key])
+        for key in keys
+    ]
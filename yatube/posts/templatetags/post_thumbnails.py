@@ -0,0 +1,37 @@
+from django import template
+
+from ..thumbnails import (
+    enqueue_thumbnails, get_display_size, lookup_thumbnail
+)
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(post, variant):
+    """ResponsiveImage картинки поста или None; недостающие миниатюры
+    ставятся в очередь. Сам тег никогда не декодирует изображение.
+
+    Если страница прогнана через prefetch_thumbnails, хранилище не
+    опрашивается вовсе.
+    """
+    image = post.image
+    if not image:
+        return None
+    prefetched = getattr(post, 'thumbnails', {})
+    if variant in prefetched:
+        thumbnail = prefetched[variant]
+    else:
+        thumbnail = lookup_thumbnail(image, variant)
+    if thumbnail is None or not thumbnail.complete:
+        enqueue_thumbnails(image.name)
+    return thumbnail
+
+
+@register.simple_tag
+def post_image_size(post, variant):
+    """Ширина и высота, которые займёт миниатюра поста."""
+    width, height = get_display_size(
+        variant, post.image_width, post.image_height
+    )
+    return {'width': width, 'height': height}
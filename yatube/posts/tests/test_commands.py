@@ -0,0 +1,51 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..models import Post, Comment, Follow, FeedEntry, UserStats
+
+User = get_user_model()
+
+
+class CommandsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='writer')
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.posts = [
+            Post.objects.create(author=cls.author, text=f'Пост {i}')
+            for i in range(3)
+        ]
+
+    def test_rebuild_follow_feed(self):
+        FeedEntry.objects.all().delete()
+        call_command('rebuild_follow_feed', stdout=StringIO())
+        self.assertEqual(
+            set(FeedEntry.objects.filter(
+                user=self.user).values_list('post_id', flat=True)),
+            {post.pk for post in self.posts}
+        )
+
+    def test_repair_counters(self):
+        Comment.objects.create(
+            post=self.posts[0], author=self.user, text='Комментарий'
+        )
+        UserStats.objects.update(posts_count=0, followers_count=0)
+        Post.objects.update(comments_count=0)
+        call_command('repair_counters', stdout=StringIO())
+        stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(stats.posts_count, len(self.posts))
+        self.assertEqual(stats.followers_count, 1)
+        self.assertEqual(
+            Post.objects.get(pk=self.posts[0].pk).comments_count, 1
+        )
+
+    def test_conditional_get_savings(self):
+        out = StringIO()
+        call_command('conditional_get_savings', '--repeat=1', stdout=out)
+        self.assertIn('-> 304', out.getvalue())
+        self.assertIn('Итого', out.getvalue())
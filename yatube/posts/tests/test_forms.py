@@ -1,27 +1,23 @@
 import shutil
 import tempfile
+from unittest import mock
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 
+from ..images import image_pool
 from ..models import Post, Group, Comment
+from ..thumbnails import lookup_thumbnail
+from .utils import HASHED_NAME, SMALL_GIF
 
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
-SMALL_GIF = (
-    b'\x47\x49\x46\x38\x39\x61\x02\x00'
-    b'\x01\x00\x80\x00\x00\x00\x00\x00'
-    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
-    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
-    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
-    b'\x0A\x00\x3B'
-)
-
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostFormTests(TestCase):
@@ -84,6 +80,36 @@ class PostFormTests(TestCase):
 
         self.assertEqual(Post.objects.count(), posts_count + 1)
 
+    def test_create_post_builds_thumbnails(self):
+        """Картинка нового поста сохраняется, миниатюры готовы заранее"""
+        self.authorized_client.post(
+            reverse('posts:post_create'), data=self.form_data
+        )
+        post = Post.objects.latest('pk')
+        self.assertTrue(post.image)
+        for variant in settings.POST_THUMBNAILS:
+            with self.subTest(variant=variant):
+                self.assertIsNotNone(lookup_thumbnail(post.image, variant))
+
+    def test_image_processed_outside_save_transaction(self):
+        """Картинка обрабатывается при проверке формы, до транзакции"""
+        depth = len(connection.savepoint_ids)
+        calls = []
+        run = image_pool.run
+
+        def spy(func, arg):
+            calls.append(len(connection.savepoint_ids))
+            return run(func, arg)
+
+        with mock.patch.object(image_pool, 'run', spy):
+            self.authorized_client.post(
+                reverse('posts:post_create'), data=self.form_data
+            )
+        self.assertEqual(calls, [depth])
+        post = Post.objects.latest('pk')
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertTrue(post.image_placeholder)
+
     def test_guest_cant_create_post(self):
         posts_count = Post.objects.count()
 
@@ -110,11 +136,11 @@ class PostFormTests(TestCase):
                              kwargs={'post_id': self.post.id}))
         self.assertEqual(Post.objects.count(), posts_count)
 
-        self.assertTrue(Post.objects.filter(
-            text=self.form_data['text'],
-            group=self.form_data['group'],
-            image=f'posts/{self.uploaded.name}'
-        ).exists())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text, self.form_data['text'])
+        self.assertEqual(self.post.group_id, self.form_data['group'])
+        # post_create тоже сохраняет картинки: имя может получить суффикс
+        self.assertRegex(self.post.image.name, HASHED_NAME + r'gif$')
 
     def test_user_cant_edit_another_post(self):
         another_user = User.objects.create_user(username='kuku')
@@ -0,0 +1,134 @@
+import io
+import shutil
+import tempfile
+import unittest
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import (
+    SimpleTestCase, TransactionTestCase, override_settings
+)
+from PIL import Image
+
+from ..images import ImageCms, to_srgb
+from ..models import Post, StoredFile
+from .utils import HASHED_NAME, SMALL_GIF
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+ORIENTATION = 0x0112
+
+
+def make_photo(width, height):
+    """JPEG, как с камеры: с EXIF-поворотом на 90° и ICC-профилем."""
+    image = Image.new('RGB', (width, height), 'teal')
+    exif = Image.Exif()
+    exif[ORIENTATION] = 6
+    buffer = io.BytesIO()
+    image.save(
+        buffer, 'JPEG', exif=exif.tobytes(), icc_profile=b'\0' * 4096
+    )
+    return buffer.getvalue()
+
+
+# файлы удаляются в on_commit, поэтому нужны настоящие транзакции
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_IMAGE_MAX_SIDE=100)
+class PostImageTests(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+
+    def create_post(self, content, filename='small.gif'):
+        return Post.objects.create(
+            author=self.user,
+            text='Пост',
+            image=SimpleUploadedFile(filename, content),
+        )
+
+    def assertNormalized(self, name):
+        with default_storage.open(name) as stored:
+            image = Image.open(stored)
+            # повёрнута по EXIF и уменьшена
+            self.assertEqual(image.size, (50, 100))
+            self.assertNotIn('exif', image.info)
+            self.assertNotIn('icc_profile', image.info)
+
+    def test_new_image_normalized_on_save(self):
+        post = self.create_post(make_photo(400, 200), 'photo.jpg')
+        self.assertRegex(post.image.name, HASHED_NAME + r'jpg$')
+        self.assertNormalized(post.image.name)
+        self.assertEqual((post.image_width, post.image_height), (50, 100))
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/jpeg;base64,')
+        )
+
+    def test_unchanged_image_described(self):
+        post = self.create_post(SMALL_GIF)
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertTrue(post.image_placeholder)
+        post.image = None
+        post.save()
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_placeholder, '')
+
+    def test_normalize_images_command(self):
+        name = default_storage.save(
+            'posts/old.jpg', ContentFile(make_photo(400, 200))
+        )
+        post = Post.objects.create(author=self.user, text='Фото', image=name)
+        Post.objects.create(
+            author=self.user, text='Без файла', image='posts/missing.jpg'
+        )
+        out = StringIO()
+        call_command('normalize_images', stdout=out)
+        self.assertIn('Обработано картинок: 1', out.getvalue())
+        self.assertIn('нет файла: 1', out.getvalue())
+        post.refresh_from_db()
+        self.assertNotEqual(post.image.name, name)
+        self.assertNormalized(post.image.name)
+        self.assertEqual((post.image_width, post.image_height), (50, 100))
+        self.assertFalse(default_storage.exists(name))
+
+    def test_duplicates_stored_once(self):
+        first = self.create_post(SMALL_GIF, 'first.gif')
+        second = self.create_post(SMALL_GIF, 'second.GIF')
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(StoredFile.objects.get(name=name).references, 2)
+        first.delete()
+        self.assertTrue(default_storage.exists(name))
+        second.delete()
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_replaced_image_released(self):
+        post = self.create_post(SMALL_GIF)
+        old_name = post.image.name
+        post.image = SimpleUploadedFile('other.jpg', make_photo(40, 20))
+        post.save()
+        self.assertFalse(default_storage.exists(old_name))
+        self.assertEqual(
+            list(StoredFile.objects.values_list('name', flat=True)),
+            [post.image.name]
+        )
+
+
+@unittest.skipIf(ImageCms is None, 'Pillow собран без littleCMS')
+class ToSrgbTests(SimpleTestCase):
+    def test_alpha_kept(self):
+        image = Image.new('RGBA', (4, 4), (0, 128, 128, 64))
+        profile = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB'))
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG', icc_profile=profile.tobytes())
+        converted = to_srgb(Image.open(buffer))
+        self.assertEqual(converted.mode, 'RGBA')
+        self.assertEqual(converted.getchannel('A').getextrema(), (64, 64))
@@ -1,7 +1,7 @@
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 
-from ..models import Group, Post, SIGNS_OF_TEXT
+from ..models import Comment, Follow, Group, Post, SIGNS_OF_TEXT
 
 
 User = get_user_model()
@@ -62,3 +62,25 @@ class PostModelTest(TestCase):
                 self.assertEqual(
                     post._meta.get_field(field).help_text, expected_value
                 )
+
+    def test_counters_follow_writes(self):
+        """Счётчики обновляются при создании и удалении записей"""
+        reader = User.objects.create_user(username='reader')
+        post = Post.objects.create(author=self.user, text='Ещё пост')
+        comment = Comment.objects.create(post=post, author=reader, text='!')
+        follow = Follow.objects.create(user=reader, author=self.user)
+        self.user.stats.refresh_from_db()
+        reader.stats.refresh_from_db()
+        post.refresh_from_db()
+        self.assertEqual(self.user.stats.posts_count, 2)
+        self.assertEqual(self.user.stats.followers_count, 1)
+        self.assertEqual(reader.stats.following_count, 1)
+        self.assertEqual(post.comments_count, 1)
+        comment.delete()
+        follow.delete()
+        post.delete()
+        self.user.stats.refresh_from_db()
+        reader.stats.refresh_from_db()
+        self.assertEqual(self.user.stats.posts_count, 1)
+        self.assertEqual(self.user.stats.followers_count, 0)
+        self.assertEqual(reader.stats.following_count, 0)
@@ -0,0 +1,79 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Follow, Group, Post
+
+User = get_user_model()
+
+AUTHORS = 5
+GROUPS = 3
+POSTS = 200
+
+
+class QueryBudgetTests(TestCase):
+    """Ленты укладываются в заявленное число запросов на большой выборке."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [
+            User.objects.create_user(username=f'author{i}')
+            for i in range(AUTHORS)
+        ]
+        cls.groups = [
+            Group.objects.create(
+                title=f'Группа {i}', slug=f'group{i}', description='Описание'
+            )
+            for i in range(GROUPS)
+        ]
+        Post.objects.bulk_create(
+            Post(
+                author=cls.authors[i % AUTHORS],
+                group=cls.groups[i % GROUPS],
+                text=f'Пост {i}'
+            )
+            for i in range(POSTS)
+        )
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def assertQueryBudget(self, client, url, budget):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(queries), budget,
+            '{} превысил бюджет в {} запросов:\n{}'.format(
+                url, budget,
+                '\n'.join(query['sql'] for query in queries.captured_queries)
+            )
+        )
+
+    def test_feed_query_budgets(self):
+        group = self.groups[0]
+        author = self.authors[0]
+        # сессия и пользователь авторизованного клиента - ещё два запроса
+        budgets = [
+            (self.guest_client, reverse('posts:index'), 1),
+            (self.guest_client, reverse('posts:index') + '?page=7', 2),
+            (self.guest_client, reverse(
+                'posts:group_list', kwargs={'slug': group.slug}), 2),
+            (self.guest_client, reverse(
+                'posts:profile', kwargs={'username': author.username}), 2),
+            (self.authorized_client, reverse(
+                'posts:profile', kwargs={'username': author.username}), 5),
+            (self.authorized_client, reverse('posts:follow_index'), 4),
+        ]
+        for client, url, budget in budgets:
+            with self.subTest(url=url):
+                self.assertQueryBudget(client, url, budget)
@@ -1,6 +1,7 @@
 from http import HTTPStatus
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase, Client
 
 from ..models import Post, Group
@@ -25,6 +26,8 @@ class PostURLTests(TestCase):
         )
 
     def setUp(self):
+        # страницы кэшируются целиком: шаблоны рендерятся только при промахе
+        cache.clear()
         self.guest_client = Client()
         self.user = PostURLTests.user
         self.authorized_client = Client()
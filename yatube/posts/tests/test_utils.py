@@ -0,0 +1,199 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ..cache import count_key
+from ..models import Group, Post
+from ..templatetags.post_cards import post_cards
+from ..thumbnails import (
+    generate_thumbnails, get_display_size, prefetch_thumbnails
+)
+from ..utils import CachedCountPaginator, ELLIPSIS
+from .utils import SMALL_GIF
+
+User = get_user_model()
+
+
+class CachedCountPaginatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        Post.objects.bulk_create(
+            Post(author=cls.user, text='Тестовый пост') for _ in range(5)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_page_window(self):
+        paginator = CachedCountPaginator(range(1000), 10)
+        page_windows = [
+            (1, [1, 2, 3, ELLIPSIS, 100]),
+            (50, [1, ELLIPSIS, 48, 49, 50, 51, 52, ELLIPSIS, 100]),
+            (100, [1, ELLIPSIS, 98, 99, 100]),
+        ]
+        for number, expected in page_windows:
+            with self.subTest(number=number):
+                self.assertEqual(paginator.get_page_window(number), expected)
+        short = CachedCountPaginator(range(30), 10)
+        self.assertEqual(short.get_page_window(2), [1, 2, 3])
+
+    def test_count_is_cached_and_invalidated(self):
+        paginator = CachedCountPaginator(Post.objects.all(), 2, 'index')
+        self.assertEqual(paginator.count, 5)
+        self.assertEqual(cache.get(count_key('index')), 5)
+        Post.objects.create(author=self.user, text='Новый пост')
+        self.assertIsNone(cache.get(count_key('index')))
+        paginator = CachedCountPaginator(Post.objects.all(), 2, 'index')
+        self.assertEqual(paginator.count, 6)
+
+
+class PostCardsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(author=self.user, text='Старый текст')
+
+    def test_cards_cached_until_post_modified(self):
+        self.assertIn('Старый текст', post_cards([self.post])[0])
+        Post.objects.filter(pk=self.post.pk).update(text='Мимо кэша')
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertIn('Старый текст', post_cards([post])[0])
+        post.text = 'Новый текст'
+        post.save()
+        self.assertIn('Новый текст', post_cards([post])[0])
+
+    def test_cards_follow_author_and_group(self):
+        group = Group.objects.create(
+            title='Группа', slug='old-slug', description='Описание'
+        )
+        self.post.group = group
+        self.post.save()
+        post = Post.objects.select_related('author', 'group').get(
+            pk=self.post.pk
+        )
+        card = post_cards([post], True, True)[0]
+        self.assertIn('old-slug', card)
+        Group.objects.filter(pk=group.pk).update(slug='new-slug')
+        User.objects.filter(pk=self.user.pk).update(first_name='Лев')
+        post = Post.objects.select_related('author', 'group').get(
+            pk=self.post.pk
+        )
+        card = post_cards([post], True, True)[0]
+        self.assertIn('new-slug', card)
+        self.assertIn('Лев', card)
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PrefetchThumbnailsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.posts = [
+            Post.objects.create(
+                author=self.user,
+                text=f'Пост {i}',
+                # разные байты: одинаковые файлы хранятся один раз
+                image=SimpleUploadedFile(
+                    f'small{i}.gif', SMALL_GIF + bytes([i])
+                ),
+            )
+            for i in range(3)
+        ]
+        for post in self.posts[:2]:
+            generate_thumbnails(post.image.name)
+        self.posts.append(Post.objects.create(author=self.user, text='Без'))
+        cache.clear()
+
+    def test_one_lookup_for_page(self):
+        with self.assertNumQueries(1):
+            prefetch_thumbnails(self.posts, ['card', 'detail'])
+        for post in self.posts[:2]:
+            self.assertTrue(post.thumbnails['card'].complete)
+            self.assertTrue(post.thumbnails['detail'].complete)
+        self.assertEqual(
+            self.posts[2].thumbnails, {'card': None, 'detail': None}
+        )
+        self.assertEqual(self.posts[3].thumbnails, {})
+        ready = self.posts[:2] + self.posts[3:]
+        with self.assertNumQueries(0):
+            prefetch_thumbnails(ready, ['card', 'detail'])
+            post_cards(ready)
+
+    def test_srcset_lists_every_width(self):
+        prefetch_thumbnails(self.posts[:1], ['detail'])
+        image = self.posts[0].thumbnails['detail']
+        widths = [
+            int(entry.rsplit(' ', 1)[1][:-1])
+            for entry in image.srcset.split(', ')
+        ]
+        self.assertEqual(
+            widths, sorted(settings.POST_THUMBNAIL_WIDTHS) + [960]
+        )
+        self.assertEqual(image.width, 960)
+        self.assertEqual(image.pick(700).x, 960)
+        self.assertEqual(image.pick(400).x, 480)
+
+    def test_backfill_thumbnails(self):
+        checkpoint = os.path.join(TEMP_MEDIA_ROOT, 'backfill.json')
+        out = StringIO()
+        call_command(
+            'backfill_thumbnails', '--batch-size=2',
+            f'--checkpoint={checkpoint}', stdout=out
+        )
+        self.assertIn(
+            'Создано миниатюр для картинок: 1, уже были: 2', out.getvalue()
+        )
+        self.assertFalse(os.path.exists(checkpoint))
+        prefetch_thumbnails(self.posts[2:3], ['card'])
+        self.assertTrue(self.posts[2].thumbnails['card'].complete)
+
+    def test_backfill_resumes_from_checkpoint(self):
+        checkpoint = os.path.join(TEMP_MEDIA_ROOT, 'backfill.json')
+        with open(checkpoint, 'w') as file_:
+            json.dump({'last_pk': self.posts[1].pk, 'ready': 2}, file_)
+        out = StringIO()
+        call_command(
+            'backfill_thumbnails', f'--checkpoint={checkpoint}', stdout=out
+        )
+        self.assertIn(f'после поста {self.posts[1].pk}', out.getvalue())
+        self.assertIn('картинок: 1, уже были: 2', out.getvalue())
+
+    def test_display_size(self):
+        # card обрезается без увеличения, detail — с увеличением
+        self.assertEqual(get_display_size('card', 2000, 500), (960, 480))
+        self.assertEqual(get_display_size('card', 600, 200), (600, 200))
+        self.assertEqual(get_display_size('detail', 600, 200), (960, 339))
+        self.assertEqual(get_display_size('card'), (960, 480))
+
+    def test_thumbnail_savings(self):
+        out = StringIO()
+        call_command('thumbnail_savings', '--pages=1', stdout=out)
+        self.assertIn('без миниатюр: 1', out.getvalue())
+        self.assertIn('Итого', out.getvalue())
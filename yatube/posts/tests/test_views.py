@@ -1,3 +1,4 @@
+import gzip
 import shutil
 import tempfile
 from random import randint
@@ -6,12 +7,17 @@ from django import forms
 from django.contrib.auth import get_user_model
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.core.cache import cache
 
-from ..models import Post, Group, Follow
-from ..utils import POSTS_ON_PAGE
+from ..cache import card_key
+from ..models import Post, Group, Follow, FeedEntry, Comment
+from ..thumbnails import generate_thumbnails
+from ..utils import POSTS_ON_PAGE, COMMENTS_ON_PAGE
+from .utils import SMALL_GIF
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -46,6 +52,8 @@ class YatubePagesTests(TestCase):
             text='Тестовый пост',
             group=YatubePagesTests.group,
             image=uploaded)
+        # страницы с заглушками вместо миниатюр не кэшируются
+        generate_thumbnails(cls.post.image.name)
 
         cls.form_fields = [
             ('text', forms.fields.CharField),
@@ -67,6 +75,7 @@ class YatubePagesTests(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -173,6 +182,7 @@ class YatubePagesTests(TestCase):
                          response.context['page_obj'])
 
     def test_cache_page_index(self):
+        """Лента берётся из кэша, пока её данные не изменились"""
         post_for_testing_cache = Post.objects.create(
             author=YatubePagesTests.user,
             text='Кеш или кэш?',
@@ -180,16 +190,40 @@ class YatubePagesTests(TestCase):
         response = self.guest_client.get(
             reverse('posts:index')
         )
-        post_for_testing_cache.delete()
-        response_after_delete = self.guest_client.get(
+        # update() не отправляет сигналов: кэш о нём не знает
+        Post.objects.filter(pk=post_for_testing_cache.pk).update(
+            text='Изменено в обход кэша'
+        )
+        response_cached = self.guest_client.get(
             reverse('posts:index')
         )
-        self.assertEqual(response.content, response_after_delete.content)
-        cache.clear()
+        self.assertEqual(response.content, response_cached.content)
+        post_for_testing_cache.delete()
         response_after_delete = self.guest_client.get(
             reverse('posts:index')
         )
         self.assertNotEqual(response.content, response_after_delete.content)
+        self.assertNotContains(response_after_delete, 'Кеш или кэш?')
+
+    def test_cache_group_and_profile_invalidated(self):
+        """Кэш групп и профилей сбрасывается новым постом"""
+        urls = [
+            reverse('posts:group_list', kwargs={
+                'slug': YatubePagesTests.group.slug}),
+            reverse('posts:profile', kwargs={
+                'username': YatubePagesTests.user.username}),
+        ]
+        for url in urls:
+            self.guest_client.get(url)
+        Post.objects.create(
+            author=YatubePagesTests.user,
+            text='Свежий пост в группе',
+            group=YatubePagesTests.group
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url),
+                                    'Свежий пост в группе')
 
     def test_profile_follow(self):
         another_user = User.objects.create_user(username='kuku')
@@ -227,6 +261,35 @@ class YatubePagesTests(TestCase):
         ))
         self.assertEqual(response.context.get('post').text, another_post.text)
 
+    def test_following_check_uses_cache(self):
+        """Проверка подписки на странице профиля не ходит в базу"""
+        another_user = User.objects.create_user(username='kuku')
+        Follow.objects.create(user=self.user, author=another_user)
+        url = reverse('posts:profile',
+                      kwargs={'username': another_user.username})
+        self.authorized_client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(url)
+        self.assertTrue(response.context['following'])
+        self.assertFalse(any(
+            'posts_follow' in query['sql'] for query in queries
+        ))
+
+    def test_follow_feed_fan_out(self):
+        """Новый пост попадает в ленту подписчика, отписка его убирает"""
+        another_user = User.objects.create_user(username='kuku')
+        Follow.objects.create(user=self.user, author=another_user)
+        new_post = Post.objects.create(author=another_user, text='Свежий')
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.user, post=new_post).exists()
+        )
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow',
+            kwargs={'username': another_user.username}))
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertNotIn(new_post, response.context['page_obj'])
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+
 
 class PaginatorTests(TestCase):
     @classmethod
@@ -261,6 +324,8 @@ class PaginatorTests(TestCase):
         ]
 
     def setUp(self):
+        # страницы для анонимов кэшируются целиком, без context
+        cache.clear()
         self.guest_client = Client()
 
     def test_first_page(self):
@@ -276,3 +341,354 @@ class PaginatorTests(TestCase):
                 response = self.guest_client.get((page_name) + '?page=2')
                 self.assertEqual(len(response.context[object_list]),
                                  PaginatorTests.posts_on_second_page)
+
+    def test_cursor_pages(self):
+        """Курсоры after/before листают ленту без номеров страниц"""
+        for page_name, object_list in self.object_list_and_page_names:
+            with self.subTest(page_name=page_name):
+                first_page = self.guest_client.get(page_name).context[
+                    object_list]
+                self.assertTrue(first_page.paginator.is_cursor)
+                self.assertFalse(first_page.has_previous())
+                response = self.guest_client.get(
+                    page_name, {'after': first_page.next_cursor})
+                second_page = response.context[object_list]
+                self.assertEqual(len(second_page),
+                                 PaginatorTests.posts_on_second_page)
+                self.assertFalse(second_page.next_cursor)
+                response = self.guest_client.get(
+                    page_name, {'before': second_page.previous_cursor})
+                self.assertEqual(
+                    list(response.context[object_list]),
+                    list(first_page)
+                )
+
+    def test_invalid_cursor_gives_first_page(self):
+        response = self.guest_client.get(reverse('posts:index'),
+                                         {'after': 'не-курсор'})
+        self.assertEqual(len(response.context['page_obj']), POSTS_ON_PAGE)
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_WORKERS=2)
+class PendingThumbnailsTests(TestCase):
+    """Пул картинок отложил миниатюры: в TestCase on_commit не
+    срабатывает, и задача так и не запускается."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Пост с картинкой',
+            group=cls.group,
+            image=SimpleUploadedFile('pending.gif', SMALL_GIF + b'pending'),
+        )
+        cls.other_post = Post.objects.create(
+            author=User.objects.create_user(username='other'),
+            text='Пост без картинки',
+        )
+        cls.urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': cls.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.pk}),
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_placeholder_not_cached(self):
+        """Страница с заглушкой не кэшируется и не получает ETag"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertContains(response, 'bg-light')
+                self.assertFalse(response.has_header('ETag'))
+                self.assertIsNone(cache.get(card_key(self.post, True, True)))
+        generate_thumbnails(self.post.image.name)
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertNotContains(response, 'bg-light')
+                self.assertContains(response, '<picture>')
+                self.assertTrue(response.has_header('ETag'))
+
+    def test_thumbnails_keep_other_etags(self):
+        """Готовые миниатюры не меняют ETag страниц без этой картинки"""
+        url = reverse(
+            'posts:post_detail', kwargs={'post_id': self.other_post.pk}
+        )
+        etag = self.guest_client.get(url)['ETag']
+        generate_thumbnails(self.post.image.name)
+        self.assertEqual(self.guest_client.get(url)['ETag'], etag)
+
+
+class CommentsPaginationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+        cls.comments_on_second_page = 3
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.user, text=f'Комментарий {i}')
+            for i in range(COMMENTS_ON_PAGE + cls.comments_on_second_page)
+        )
+
+    def setUp(self):
+        # страницы для анонимов кэшируются целиком, без context
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_post_detail_comments_fixed_queries(self):
+        """Пост и страница комментариев с авторами: два запроса"""
+        with self.assertNumQueries(2):
+            response = self.guest_client.get(reverse(
+                'posts:post_detail', kwargs={'post_id': self.post.pk}))
+        self.assertEqual(len(response.context['comments']), COMMENTS_ON_PAGE)
+
+    def test_post_comments_next_batch(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.guest_client.get(url)
+        cursor = response.context['comments'].next_cursor
+        self.assertContains(response, f'{url}?after={cursor}#comments')
+        response = self.guest_client.get(url, {'after': cursor})
+        self.assertTemplateUsed(response, 'posts/post_detail.html')
+        self.assertEqual(len(response.context['comments']),
+                         self.comments_on_second_page)
+
+    def test_post_comments_fragment(self):
+        response = self.guest_client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}))
+        cursor = response.context['comments'].next_cursor
+        response = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            {'after': cursor}
+        )
+        self.assertTemplateUsed(response, 'includes/comments_list.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertNotContains(response, '<html')
+        self.assertEqual(len(response.context['comments']),
+                         self.comments_on_second_page)
+        self.assertContains(response, f'Комментарий {COMMENTS_ON_PAGE}')
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def assertRevalidated(self, url, change):
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('no-cache', response['Cache-Control'])
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_new_post_changes_feeds(self):
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.author.username]),
+        ]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        Post.objects.create(author=self.author, text='Новый', group=self.group)
+        for url, etag in zip(urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_comment_changes_post_detail(self):
+        self.assertRevalidated(
+            reverse('posts:post_detail', args=[self.post.pk]),
+            lambda: Comment.objects.create(
+                post=self.post, author=self.reader, text='Комментарий'
+            )
+        )
+
+    def test_follow_changes_profile(self):
+        self.client.force_login(self.reader)
+        self.assertRevalidated(
+            reverse('posts:profile', args=[self.author.username]),
+            lambda: Follow.objects.create(user=self.reader, author=self.author)
+        )
+
+    def test_follow_changes_follower_profile(self):
+        self.assertRevalidated(
+            reverse('posts:profile', args=[self.reader.username]),
+            lambda: Follow.objects.create(user=self.reader, author=self.author)
+        )
+
+    def test_etag_depends_on_viewer(self):
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.reader)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_missing_objects_not_found(self):
+        for url in (
+            reverse('posts:group_list', args=['missing']),
+            reverse('posts:profile', args=['missing']),
+            reverse('posts:post_detail', args=[self.post.pk + 100]),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def assertCached(self, url):
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), first.content)
+        return first
+
+    def test_anonymous_pages_cached(self):
+        for url in (
+            reverse('posts:index'),
+            reverse('posts:index') + '?page=2',
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:post_detail', args=[self.post.pk]),
+        ):
+            with self.subTest(url=url):
+                self.assertCached(url)
+                response = self.client.get(url)
+                self.assertNotIn('Content-Encoding', response)
+
+    def test_cached_page_revalidated(self):
+        url = reverse('posts:index')
+        etag = self.assertCached(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def assertRefreshed(self, url, write, text):
+        self.assertCached(url)
+        write()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertTrue(queries)
+        self.assertContains(response, text)
+
+    def test_new_post_invalidates_feed(self):
+        self.assertRefreshed(
+            reverse('posts:index'),
+            lambda: Post.objects.create(author=self.author, text='Свежий'),
+            'Свежий'
+        )
+
+    def test_comment_invalidates_post(self):
+        self.assertRefreshed(
+            reverse('posts:post_detail', args=[self.post.pk]),
+            lambda: Comment.objects.create(
+                post=self.post, author=self.author, text='Комментарий'
+            ),
+            'Комментарий'
+        )
+
+    def test_group_edit_invalidates_group(self):
+        def rename():
+            self.group.title = 'Новое название'
+            self.group.save()
+        self.assertRefreshed(
+            reverse('posts:group_list', args=[self.group.slug]),
+            rename,
+            'Новое название'
+        )
+
+    def test_group_edit_invalidates_posts_pages(self):
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:post_detail', args=[self.post.pk]),
+        ]
+        for url in urls:
+            self.assertCached(url)
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'new-slug'
+        group.save()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'new-slug')
+
+    def test_group_delete_invalidates_posts_pages(self):
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        self.assertContains(self.client.get(url), 'Группа:')
+        Group.objects.get(pk=self.group.pk).delete()
+        self.assertNotContains(self.client.get(url), 'Группа:')
+
+    def test_follow_invalidates_follower_profile(self):
+        follower = User.objects.create_user(username='follower')
+        url = reverse('posts:profile', args=[follower.username])
+        self.assertContains(self.assertCached(url), 'подписок: 0')
+        Follow.objects.create(user=follower, author=self.author)
+        self.assertContains(self.client.get(url), 'подписок: 1')
+
+    def test_logged_in_users_share_cached_page(self):
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        self.client.get(url)
+        reader = User.objects.create_user(username='reader')
+        for user, is_author in ((self.author, True), (reader, False)):
+            with self.subTest(user=user.username):
+                self.client.force_login(user)
+                response = self.client.get(url)
+                self.assertTemplateNotUsed(response, 'posts/post_detail.html')
+                self.assertContains(response, f'Пользователь: {user}')
+                self.assertContains(response, 'Добавить комментарий')
+                # токен формы комментария отрисован во вставке
+                self.assertIn('csrftoken', response.cookies)
+                self.assertEqual(
+                    'Редактировать запись' in response.content.decode(),
+                    is_author
+                )
+                self.assertIn('private', response['Cache-Control'])
+                self.assertNotIn('<!--personal:', response.content.decode())
+
+    def test_follow_button_personal(self):
+        url = reverse('posts:profile', args=[self.author.username])
+        reader = User.objects.create_user(username='reader')
+        self.client.force_login(reader)
+        self.assertContains(self.client.get(url), 'Подписаться')
+        Follow.objects.create(user=reader, author=self.author)
+        self.assertContains(self.client.get(url), 'Отписаться')
+        self.client.logout()
+        self.assertContains(self.client.get(url), 'Подписаться')
@@ -0,0 +1,334 @@
+import logging
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from PIL import features
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend as SorlThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import (
+    EMPTY_VALUE, KVStore as CachedDbKVStore
+)
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core.imaging import JobTimeout, POOL_BUSY_ERRORS, image_pool
+from .storage import post_image_storage
+
+logger = logging.getLogger(__name__)
+
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+class ThumbnailBackend(SorlThumbnailBackend):
+    """Бэкенд sorl, который умеет искать миниатюру, не создавая её."""
+
+    def get_options(self, source, options):
+        options = dict(options)
+        # те же умолчания, что подставляет get_thumbnail(): иначе имя
+        # файла миниатюры не совпадёт
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        return options
+
+    def get_thumbnail_file(self, file_, geometry_string, **options):
+        """ImageFile будущей миниатюры: имя считается без чтения файлов."""
+        source = ImageFile(file_)
+        options = self.get_options(source, options)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def lookup(self, file_, geometry_string, **options):
+        """Готовая миниатюра из key-value store или None."""
+        if not file_:
+            return None
+        thumbnail = self.get_thumbnail_file(file_, geometry_string, **options)
+        return default.kvstore.get(thumbnail)
+
+
+class ResponsiveImage:
+    """Миниатюры одного варианта во всех ширинах и форматах.
+
+    url, width и height — у самой крупной миниатюры запасного формата
+    (последнего в POST_THUMBNAIL_FORMATS), её понимает любой браузер.
+    """
+
+    def __init__(self, formats):
+        self.formats = formats
+        self.files = {fmt: {} for fmt in formats}
+        self.complete = True
+
+    def add(self, fmt, thumbnail):
+        if thumbnail is None:
+            self.complete = False
+        else:
+            # ширина — настоящая: без upscale миниатюра бывает меньше
+            self.files[fmt][thumbnail.x] = thumbnail
+
+    def get_srcset(self, fmt):
+        return ', '.join(
+            f'{thumbnail.url} {width}w'
+            for width, thumbnail in sorted(self.files[fmt].items())
+        )
+
+    @property
+    def fallback(self):
+        files = self.files[self.formats[-1]]
+        return files[max(files)] if files else None
+
+    @property
+    def url(self):
+        return self.fallback.url
+
+    @property
+    def width(self):
+        return self.fallback.x
+
+    @property
+    def height(self):
+        return self.fallback.y
+
+    @property
+    def srcset(self):
+        return self.get_srcset(self.formats[-1])
+
+    @property
+    def sources(self):
+        """<source> для современных форматов, от лучшего к худшему."""
+        return [
+            {'type': f'image/{fmt.lower()}', 'srcset': self.get_srcset(fmt)}
+            for fmt in self.formats[:-1] if self.files[fmt]
+        ]
+
+    def pick(self, min_width):
+        """Миниатюра, которую браузер выберет для min_width пикселей."""
+        for fmt in self.formats:
+            widths = sorted(self.files[fmt])
+            if widths:
+                fit = [width for width in widths if width >= min_width]
+                return self.files[fmt][fit[0] if fit else widths[-1]]
+        return None
+
+
+@lru_cache(maxsize=None)
+def webp_supported():
+    return features.check('webp')
+
+
+def get_formats():
+    """Форматы миниатюр; WebP — только если Pillow собран с ним."""
+    return tuple(
+        fmt for fmt in settings.POST_THUMBNAIL_FORMATS
+        if fmt != 'WEBP' or webp_supported()
+    )
+
+
+def get_variant(name):
+    return settings.POST_THUMBNAILS[name]
+
+
+def get_display_size(variant, width=None, height=None):
+    """Размер миниатюры варианта для картинки width x height — так же,
+    как его посчитает sorl: по нему браузер резервирует место до загрузки.
+
+    Без размеров исходника возвращается геометрия варианта.
+    """
+    geometry, options = get_variant(variant)
+    box_width, box_height = (int(side) for side in geometry.split('x'))
+    if not width or not height:
+        return box_width, box_height
+    ratios = (box_width / width, box_height / height)
+    crop = options.get('crop')
+    factor = max(ratios) if crop else min(ratios)
+    if factor < 1 or options.get('upscale', sorl_settings.THUMBNAIL_UPSCALE):
+        width = max(int(round(width * factor)), 1)
+        height = max(int(round(height * factor)), 1)
+    if crop:
+        width, height = min(width, box_width), min(height, box_height)
+    return width, height
+
+
+def get_renditions(variant):
+    """Все миниатюры варианта: (формат, геометрия, опции).
+
+    Ширины берутся из POST_THUMBNAIL_WIDTHS, не больше ширины самого
+    варианта; пропорции сохраняются.
+    """
+    geometry, options = get_variant(variant)
+    width, height = (int(side) for side in geometry.split('x'))
+    widths = {size for size in settings.POST_THUMBNAIL_WIDTHS if size < width}
+    renditions = []
+    for fmt in get_formats():
+        for size in sorted(widths | {width}):
+            renditions.append((
+                fmt,
+                f'{size}x{round(height * size / width)}',
+                {**options, 'format': fmt},
+            ))
+    return renditions
+
+
+def get_raw_many(keys):
+    """Сырые значения key-value store sorl: один get_many кэша и не больше
+    одного запроса к базе за промахи."""
+    kvstore = default.kvstore
+    values = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        rows = dict(
+            KVStoreModel.objects.filter(key__in=missing).values_list(
+                'key', 'value'
+            )
+        )
+        # как и sorl, запоминаем и отсутствие значения
+        fetched = {key: rows.get(key, EMPTY_VALUE) for key in missing}
+        kvstore.cache.set_many(
+            fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT
+        )
+        values.update(fetched)
+    return {
+        key: value for key, value in values.items() if value != EMPTY_VALUE
+    }
+
+
+def resolve_thumbnails(images, variants):
+    """ResponsiveImage (или None) для каждой пары (имя файла, вариант).
+
+    Все миниатюры всех картинок ищутся одной выборкой.
+    """
+    formats = get_formats()
+    wanted = {}
+    for image in images:
+        for variant in variants:
+            for fmt, geometry, options in get_renditions(variant):
+                thumbnail = default.backend.get_thumbnail_file(
+                    image, geometry, **options
+                )
+                wanted.setdefault(add_prefix(thumbnail.key), []).append(
+                    (image.name, variant, fmt)
+                )
+    if isinstance(default.kvstore, CachedDbKVStore):
+        values = get_raw_many(list(wanted))
+    else:
+        values = {key: default.kvstore._get_raw(key) for key in wanted}
+    resolved = {}
+    for key, targets in wanted.items():
+        value = values.get(key)
+        thumbnail = deserialize_image_file(value) if value else None
+        for name, variant, fmt in targets:
+            image = resolved.setdefault(
+                (name, variant), ResponsiveImage(formats)
+            )
+            image.add(fmt, thumbnail)
+    return {
+        pair: image if image.fallback else None
+        for pair, image in resolved.items()
+    }
+
+
+def lookup_thumbnail(image, variant):
+    if not image:
+        return None
+    return resolve_thumbnails([image], [variant]).get((image.name, variant))
+
+
+def prefetch_thumbnails(posts, variants):
+    """Находит миниатюры всех постов страницы одной выборкой.
+
+    Результат кладётся в post.thumbnails[variant] (None, если миниатюр
+    ещё нет), и тег post_thumbnail больше не обращается к хранилищу.
+    """
+    posts = list(posts)
+    resolved = resolve_thumbnails(
+        [post.image for post in posts if post.image], variants
+    )
+    for post in posts:
+        post.thumbnails = {}
+        if post.image:
+            for variant in variants:
+                post.thumbnails[variant] = resolved.get(
+                    (post.image.name, variant)
+                )
+
+
+def thumbnails_ready(posts, variant):
+    """Готовы ли все миниатюры варианта у постов, прогнанных через
+    prefetch_thumbnails.
+
+    Пока нет, вместо картинок на странице заглушки, и её нельзя
+    кэшировать: заглушка сменится картинкой без изменения самих постов.
+    """
+    for post in posts:
+        if post.image:
+            image = post.thumbnails.get(variant)
+            if image is None or not image.complete:
+                return False
+    return True
+
+
+def generate_thumbnails(name):
+    """Создаёт все варианты миниатюр файла name во всех ширинах и
+    форматах; False, если исходного файла нет."""
+    if not post_image_storage.exists(name):
+        logger.warning('Нет исходного файла для миниатюр: %s', name)
+        return False
+    # ключ миниатюр зависит от хранилища исходника, а не только от имени
+    source = ImageFile(name, post_image_storage)
+    for variant in settings.POST_THUMBNAILS:
+        for _, geometry, options in get_renditions(variant):
+            default.backend.get_thumbnail(source, geometry, **options)
+    return True
+
+
+def build_thumbnails(name):
+    try:
+        generate_thumbnails(name)
+    except JobTimeout:
+        raise
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+
+
+def release(name):
+    with _pending_lock:
+        _pending.discard(name)
+
+
+def submit_job(name):
+    with _pending_lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    try:
+        future = image_pool.submit(build_thumbnails, name)
+    except POOL_BUSY_ERRORS:
+        # не страшно: тег post_thumbnail поставит файл снова при показе
+        logger.warning('Очередь картинок занята, миниатюры %s отложены', name)
+        release(name)
+        return
+    future.add_done_callback(lambda done: release(name))
+
+
+def enqueue_thumbnails(name):
+    """Ставит файл в очередь пула картинок после коммита.
+
+    Файл, который уже в очереди, повторно не ставится. При
+    IMAGE_WORKERS = 0 миниатюры создаются сразу, в этом потоке.
+    """
+    if not name:
+        return
+    if not settings.IMAGE_WORKERS:
+        build_thumbnails(name)
+        return
+    transaction.on_commit(lambda: submit_job(name))
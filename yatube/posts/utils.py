@@ -1,10 +1,178 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .cache import get_feed_count
 
 POSTS_ON_PAGE = 10
+COMMENTS_ON_PAGE = 20
+FEED_ORDERING = ('-pub_date', '-id')
+FOLLOW_FEED_ORDERING = ('-pub_date', '-post_id')
+COMMENTS_ORDERING = ('created', 'id')
+PAGES_ON_EACH_SIDE = 2
+PAGES_ON_ENDS = 1
+ELLIPSIS = '…'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator для ссылок ?page=N с кэшированным COUNT(*) ленты."""
+
+    def __init__(self, object_list, per_page, feed=None):
+        super().__init__(object_list, per_page)
+        self.feed = feed
+
+    @cached_property
+    def count(self):
+        if self.feed is None:
+            return self.count_rows()
+        return get_feed_count(self.feed, self.count_rows)
+
+    def count_rows(self):
+        return super().count
+
+    def get_page_window(self, number, on_each_side=PAGES_ON_EACH_SIDE,
+                        on_ends=PAGES_ON_ENDS):
+        """Первые, последние и соседние с текущей номера страниц.
+
+        Пропуски между ними обозначены ELLIPSIS.
+        """
+        if self.num_pages <= (on_each_side + on_ends) * 2 + 1:
+            return list(self.page_range)
+        window = []
+        if number > on_each_side + on_ends + 1:
+            window.extend(range(1, on_ends + 1))
+            window.append(ELLIPSIS)
+            window.extend(range(number - on_each_side, number + 1))
+        else:
+            window.extend(range(1, number + 1))
+        if number < self.num_pages - on_each_side - on_ends:
+            window.extend(range(number + 1, number + on_each_side + 1))
+            window.append(ELLIPSIS)
+            window.extend(
+                range(self.num_pages - on_ends + 1, self.num_pages + 1)
+            )
+        else:
+            window.extend(range(number + 1, self.num_pages + 1))
+        return window
+
+
+class CursorPaginator(Paginator):
+    """Пагинация по ключу сортировки (keyset): без COUNT(*) и OFFSET.
+
+    Каждая страница читается одним запросом по индексу, поэтому стоимость
+    не зависит от глубины. Номер страницы условный: 1 для первой, 2 для
+    любой последующей.
+    """
+
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, ordering=FEED_ORDERING):
+        super().__init__(object_list.order_by(*ordering), per_page)
+        self.ordering = ordering
+        self.keys = [
+            (field.lstrip('-'), field.startswith('-')) for field in ordering
+        ]
+
+    def encode_cursor(self, obj):
+        values = [getattr(obj, name) for name, _ in self.keys]
+        raw = json.dumps(values, default=str).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            values = json.loads(raw)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise InvalidCursor(token)
+        if not isinstance(values, list) or len(values) != len(self.keys):
+            raise InvalidCursor(token)
+        model = self.object_list.model
+        try:
+            return [
+                model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(self.keys, values)
+            ]
+        except ValidationError:
+            raise InvalidCursor(token)
+
+    def keyset_filter(self, values, backwards):
+        """Условие «строго после курсора» в порядке сортировки ленты."""
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self.keys, values):
+            lookup = 'gt' if descending == backwards else 'lt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def get_cursor_page(self, after=None, before=None):
+        token, backwards = (before, True) if before else (after, False)
+        queryset = self.object_list
+        if token:
+            try:
+                values = self.decode_cursor(token)
+            except InvalidCursor:
+                token = None
+            else:
+                queryset = queryset.filter(
+                    self.keyset_filter(values, backwards)
+                )
+        if backwards and token:
+            queryset = queryset.reverse()
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards and token:
+            rows.reverse()
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = bool(token), has_more
+        number = 2 if has_previous else 1
+        self.num_pages = number + has_next
+        page = Page(rows, number, self)
+        page.next_cursor = (
+            self.encode_cursor(rows[-1]) if has_next and rows else ''
+        )
+        page.previous_cursor = (
+            self.encode_cursor(rows[0]) if has_previous and rows else ''
+        )
+        return page
+
+
+def get_page_number(value, request, ordering=FEED_ORDERING, feed=None):
+    if 'page' in request.GET:
+        # старые ссылки вида ?page=N продолжают работать
+        paginator = CachedCountPaginator(
+            value.order_by(*ordering), POSTS_ON_PAGE, feed
+        )
+        page_obj = paginator.get_page(request.GET.get('page'))
+        page_obj.page_window = paginator.get_page_window(page_obj.number)
+        return page_obj
+    return get_cursor_page(value, request, ordering)
+
+
+def get_cursor_page(value, request, ordering=FEED_ORDERING,
+                    per_page=POSTS_ON_PAGE):
+    """Страница по курсорам ?after= и ?before=."""
+    paginator = CursorPaginator(value, per_page, ordering)
+    return paginator.get_cursor_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
 
 
-def get_page_number(value, request):
-    paginator = Paginator(value, POSTS_ON_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+def get_comments_page(comments, request):
+    """Очередная порция комментариев вместе с авторами: один запрос."""
+    paginator = CursorPaginator(
+        comments.select_related('author'), COMMENTS_ON_PAGE, COMMENTS_ORDERING
+    )
+    return paginator.get_cursor_page(after=request.GET.get('after'))
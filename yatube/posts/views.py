@@ -1,50 +1,81 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-
-from .utils import get_page_number
+from django.db import transaction
+
+from .cache import get_following_ids, get_generation, FEED_CACHE_TIMEOUT
+from .conditional import (
+    conditional_page, get_page_object, group_etag, index_etag,
+    mark_incomplete, post_etag, profile_etag
+)
+from .utils import get_comments_page, get_page_number
 from .models import Post, Group, User, Follow
 from .forms import PostForm, CommentForm
-
-
+from .queries import (
+    author_feed, author_queryset, get_follow_page, group_feed, index_feed,
+    post_queryset
+)
+from .thumbnails import (
+    enqueue_thumbnails, prefetch_thumbnails, thumbnails_ready
+)
+
+
+def feed_cache_timeout(request, page_obj):
+    """Срок кэша фрагмента с карточками страницы; 0 — не кэшировать,
+    пока у постов страницы не готовы миниатюры."""
+    prefetch_thumbnails(page_obj, ['card'])
+    if thumbnails_ready(page_obj, 'card'):
+        return FEED_CACHE_TIMEOUT
+    mark_incomplete(request)
+    return 0
+
+
+@conditional_page(index_etag)
 def index(request):
-    posts = Post.objects.select_related('group', 'author')
-    page_obj = get_page_number(posts, request)
+    posts, feed = index_feed()
+    page_obj = get_page_number(posts.for_cards(), request, feed=feed)
     context = {
         'page_obj': page_obj,
+        'feed_generation': get_generation(feed),
+        'feed_cache_timeout': feed_cache_timeout(request, page_obj),
     }
     return render(request, 'posts/index.html', context)
 
 
+@conditional_page(group_etag)
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    page_obj = get_page_number(posts, request)
+    group = get_page_object(request, Group.objects.all(), slug=slug)
+    posts, feed = group_feed(group)
+    page_obj = get_page_number(posts.for_cards(), request, feed=feed)
     context = {
         'group': group,
         'page_obj': page_obj,
+        'feed_generation': get_generation(feed),
+        'feed_cache_timeout': feed_cache_timeout(request, page_obj),
     }
-    return render(request, 'posts/group_list.html', context, slug)
+    return render(request, 'posts/group_list.html', context)
 
 
+@conditional_page(profile_etag)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
-    following = False
-    page_obj = get_page_number(posts, request)
-    if (request.user.is_authenticated
-       and Follow.objects.filter(user=request.user).filter(author=author)):
-        following = True
+    author = get_page_object(request, author_queryset(), username=username)
+    posts, feed = author_feed(author)
+    page_obj = get_page_number(posts.for_cards(), request, feed=feed)
     context = {
         'author': author,
         'page_obj': page_obj,
-        'following': following
+        'feed_generation': get_generation(feed),
+        'feed_cache_timeout': feed_cache_timeout(request, page_obj),
     }
     return render(request, 'posts/profile.html', context)
 
 
+@conditional_page(post_etag)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    comments = post.comments.all()
+    post = get_page_object(request, post_queryset(), pk=post_id)
+    prefetch_thumbnails([post], ['detail'])
+    if not thumbnails_ready([post], 'detail'):
+        mark_incomplete(request)
+    comments = get_comments_page(post.comments.all(), request)
     form = CommentForm()
     context = {
         'form': form,
@@ -54,13 +85,30 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    """Следующая порция комментариев HTML-фрагментом, без макета
+    страницы: её дописывает в конец списка скрипт post_detail."""
+    post = get_object_or_404(Post.objects.only('id'), pk=post_id)
+    context = {
+        'comments': get_comments_page(post.comments.all(), request),
+        'post': post,
+    }
+    return render(request, 'includes/comments_list.html', context)
+
+
 @login_required
 def post_create(request):
-    form = PostForm(request.POST or None)
+    form = PostForm(
+        request.POST or None,
+        files=request.FILES or None,
+        user=request.user
+    )
     if form.is_valid():
-        post = form.save(commit=False)
-        post.author = request.user
-        post.save()
+        with transaction.atomic():
+            post = form.save(commit=False)
+            post.author = request.user
+            post.save()
+            enqueue_thumbnails(post.image.name)
         return redirect('posts:profile', username=post.author)
     context = {
         'form': form,
@@ -76,10 +124,13 @@ def post_edit(request, post_id):
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
-        instance=post
+        instance=post,
+        user=request.user
     )
     if form.is_valid():
-        form.save()
+        post = form.save()
+        if form.image_changed:
+            enqueue_thumbnails(post.image.name)
         return redirect('posts:post_detail', post_id=post_id)
     context = {
         'post': post,
@@ -90,6 +141,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -103,27 +155,27 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = get_page_number(posts, request)
+    page_obj = get_follow_page(request, Post.objects.for_cards())
     context = {
-        'posts': posts,
         'page_obj': page_obj,
     }
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
-    if author != request.user:
+    if (author != request.user
+       and author.pk not in get_following_ids(request.user)):
         Follow.objects.get_or_create(user=request.user, author=author)
     return redirect('posts:profile', author)
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    following_author = request.user.follower.filter(author=author)
-    if following_author.exists():
-        following_author.delete()
+    if author.pk in get_following_ids(request.user):
+        request.user.follower.filter(author=author).delete()
     return redirect('posts:profile', username=username)
@@ -0,0 +1,55 @@
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from uploads.models import Upload
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет загрузки старше UPLOAD_EXPIRY: незавершённые, с ошибкой и '
+        'готовые, но так и не прикреплённые к посту, вместе с их файлами'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--expiry', type=int, default=None,
+            help='Возраст в секундах, по умолчанию UPLOAD_EXPIRY'
+        )
+
+    def handle(self, *args, **options):
+        expiry = options['expiry']
+        if expiry is None:
+            expiry = settings.UPLOAD_EXPIRY
+        cutoff = timezone.now() - timedelta(seconds=expiry)
+        uploads = list(Upload.objects.filter(created__lt=cutoff))
+        for upload in uploads:
+            upload.remove_chunks()
+            # готовый файл освобождает сигнал post_delete
+            upload.delete()
+        removed = self.remove_stale_files(time.time() - expiry)
+        self.stdout.write(
+            f'Удалено загрузок: {len(uploads)}, временных файлов: {removed}'
+        )
+
+    def remove_stale_files(self, cutoff):
+        """Куски, которые пережили свою загрузку: например, после
+        оборванного запроса или падения процесса."""
+        try:
+            names = os.listdir(settings.UPLOAD_CHUNKS_DIR)
+        except FileNotFoundError:
+            return 0
+        removed = 0
+        for name in names:
+            path = os.path.join(settings.UPLOAD_CHUNKS_DIR, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
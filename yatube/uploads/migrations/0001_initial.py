@@ -0,0 +1,35 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Upload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255, verbose_name='Имя файла')),
+                ('size', models.PositiveIntegerField(verbose_name='Размер файла')),
+                ('offset', models.PositiveIntegerField(default=0, help_text='С этого места продолжается загрузка', verbose_name='Получено байт')),
+                ('status', models.CharField(choices=[('pending', 'Загружается'), ('done', 'Готова'), ('failed', 'Ошибка')], default='pending', max_length=7, verbose_name='Состояние')),
+                ('image', models.CharField(blank=True, help_text='Имя готового файла в хранилище', max_length=100, verbose_name='Картинка')),
+                ('error', models.CharField(blank=True, max_length=255, verbose_name='Ошибка')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+    ]
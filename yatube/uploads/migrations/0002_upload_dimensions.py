@@ -0,0 +1,28 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='upload',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Высота'),
+        ),
+        migrations.AddField(
+            model_name='upload',
+            name='placeholder',
+            field=models.TextField(blank=True, verbose_name='Превью'),
+        ),
+        migrations.AddField(
+            model_name='upload',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Ширина'),
+        ),
+    ]
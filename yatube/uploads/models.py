@@ -0,0 +1,68 @@
+import os
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import models
+
+User = get_user_model()
+
+
+class Upload(models.Model):
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'Загружается'),
+        (DONE, 'Готова'),
+        (FAILED, 'Ошибка'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='uploads',
+        verbose_name='Пользователь'
+    )
+    filename = models.CharField('Имя файла', max_length=255)
+    size = models.PositiveIntegerField('Размер файла')
+    offset = models.PositiveIntegerField(
+        'Получено байт',
+        default=0,
+        help_text='С этого места продолжается загрузка'
+    )
+    status = models.CharField(
+        'Состояние',
+        max_length=7,
+        choices=STATUSES,
+        default=PENDING
+    )
+    image = models.CharField(
+        'Картинка',
+        max_length=100,
+        blank=True,
+        help_text='Имя готового файла в хранилище'
+    )
+    width = models.PositiveIntegerField('Ширина', null=True, blank=True)
+    height = models.PositiveIntegerField('Высота', null=True, blank=True)
+    placeholder = models.TextField('Превью', blank=True)
+    error = models.CharField('Ошибка', max_length=255, blank=True)
+    created = models.DateTimeField('Дата создания', auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created']
+
+    def __str__(self):
+        return self.filename
+
+    @property
+    def chunks_path(self):
+        """Временный файл, в который дописываются куски."""
+        return os.path.join(settings.UPLOAD_CHUNKS_DIR, f'{self.pk}.part')
+
+    def remove_chunks(self):
+        try:
+            os.remove(self.chunks_path)
+        except FileNotFoundError:
+            pass
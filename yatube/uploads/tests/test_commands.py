@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+
+from ..models import Upload
+from .utils import make_png
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_CHUNKS_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    UPLOAD_CHUNKS_DIR=TEMP_CHUNKS_DIR,
+    UPLOAD_EXPIRY=60,
+)
+# файлы удаляются в on_commit, поэтому нужны настоящие транзакции
+class CleanUploadsTests(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(TEMP_CHUNKS_DIR, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+
+    def make_upload(self, age, **fields):
+        upload = Upload.objects.create(
+            user=self.user, filename='photo.png', size=100, **fields
+        )
+        Upload.objects.filter(pk=upload.pk).update(
+            created=timezone.now() - timedelta(seconds=age)
+        )
+        open(upload.chunks_path, 'wb').close()
+        return upload
+
+    def test_expired_uploads_removed(self):
+        name = default_storage.save(
+            'posts/photo.png', ContentFile(make_png(20, 10))
+        )
+        expired = [
+            self.make_upload(120),
+            self.make_upload(120, status=Upload.DONE, image=name),
+        ]
+        fresh = self.make_upload(10)
+        stale = os.path.join(TEMP_CHUNKS_DIR, 'lost.part.chunk')
+        open(stale, 'wb').close()
+        os.utime(stale, (time.time() - 120,) * 2)
+        call_command('clean_uploads', stdout=StringIO())
+        self.assertEqual(list(Upload.objects.all()), [fresh])
+        for upload in expired:
+            self.assertFalse(os.path.exists(upload.chunks_path))
+        self.assertTrue(os.path.exists(fresh.chunks_path))
+        self.assertFalse(os.path.exists(stale))
+        self.assertFalse(default_storage.exists(name))
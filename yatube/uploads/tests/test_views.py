@@ -0,0 +1,210 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings
+)
+from django.urls import reverse
+from PIL import Image
+
+from core.imaging import QueueFull, image_pool
+from posts.models import Post
+from posts.tests.utils import HASHED_NAME
+from .. import views
+from ..models import Upload
+from .utils import make_png
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_CHUNKS_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    UPLOAD_CHUNKS_DIR=TEMP_CHUNKS_DIR,
+    UPLOAD_CHUNK_SIZE=1024,
+    POST_IMAGE_MAX_SIDE=300,
+)
+class UploadViewsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(TEMP_CHUNKS_DIR, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def start(self, data, filename='photo.png'):
+        response = self.client.post(
+            reverse('uploads:upload_create'),
+            {'filename': filename, 'size': len(data)}
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def send(self, upload_id, data, offset):
+        return self.client.patch(
+            reverse('uploads:upload_detail', args=[upload_id]),
+            data[offset:offset + 1024],
+            content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def upload(self, data, filename='photo.png'):
+        state = self.start(data, filename)
+        while state['offset'] < len(data):
+            state = self.send(state['id'], data, state['offset']).json()
+        return state
+
+    def test_chunked_upload_is_downscaled(self):
+        data = make_png(600, 200)
+        state = self.upload(data)
+        self.assertEqual(state['status'], Upload.DONE)
+        upload = Upload.objects.get(pk=state['id'])
+        self.assertRegex(upload.image, HASHED_NAME + r'png$')
+        with default_storage.open(upload.image) as image:
+            self.assertEqual(Image.open(image).size, (300, 100))
+
+    def test_resume_after_wrong_offset(self):
+        data = make_png(600, 200)
+        state = self.start(data)
+        self.send(state['id'], data, 0)
+        response = self.send(state['id'], data, 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 1024)
+        response = self.client.get(
+            reverse('uploads:upload_detail', args=[state['id']])
+        )
+        self.assertEqual(response.json()['offset'], 1024)
+
+    def test_offset_changed_during_transfer(self):
+        """Пока кусок шёл по сети, его записал параллельный запрос"""
+        data = make_png(600, 200)
+        state = self.start(data)
+        write_chunk = views.write_chunk
+
+        def racing_write_chunk(request, upload, length):
+            path = write_chunk(request, upload, length)
+            Upload.objects.filter(pk=upload.pk).update(offset=1024)
+            return path
+
+        with mock.patch.object(views, 'write_chunk', racing_write_chunk):
+            response = self.send(state['id'], data, 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 1024)
+        files = [
+            name for name in os.listdir(TEMP_CHUNKS_DIR)
+            if name.startswith(state['id'])
+        ]
+        self.assertEqual(files, [f'{state["id"]}.part'])
+
+    def test_not_an_image_fails(self):
+        state = self.upload(b'not an image' * 100, 'photo.jpg')
+        self.assertEqual(state['status'], Upload.FAILED)
+        self.assertTrue(state['error'])
+
+    def test_foreign_upload_not_found(self):
+        state = self.start(make_png(10, 10))
+        other = Client()
+        other.force_login(User.objects.create_user(username='other'))
+        response = other.get(
+            reverse('uploads:upload_detail', args=[state['id']])
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_post_create_uses_upload(self):
+        state = self.upload(make_png(600, 200))
+        response = self.client.post(
+            reverse('posts:post_create'),
+            {'text': 'Пост с загрузкой', 'upload': state['id']}
+        )
+        self.assertRedirects(
+            response, reverse('posts:profile', args=[self.user.username])
+        )
+        post = Post.objects.get(text='Пост с загрузкой')
+        self.assertRegex(post.image.name, HASHED_NAME + r'png$')
+        self.assertEqual((post.image_width, post.image_height), (300, 100))
+        self.assertTrue(post.image_placeholder)
+        self.assertFalse(Upload.objects.exists())
+
+    def test_post_create_rejects_unfinished_upload(self):
+        state = self.start(make_png(600, 200))
+        response = self.client.post(
+            reverse('posts:post_create'),
+            {'text': 'Пост', 'upload': state['id']}
+        )
+        self.assertTrue(response.context['form'].non_field_errors())
+        self.assertFalse(Post.objects.exists())
+
+    def test_busy_pool_retried(self):
+        data = make_png(20, 10)
+        state = self.start(data)
+        with mock.patch.object(image_pool, 'run', side_effect=QueueFull):
+            response = self.send(state['id'], data, 0)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['offset'], len(data))
+        response = self.send(state['id'], data, len(data))
+        self.assertEqual(response.json()['status'], Upload.DONE)
+
+
+# файлы удаляются в on_commit, поэтому нужны настоящие транзакции
+class UploadFilesTests(TransactionTestCase):
+    def setUp(self):
+        # свои каталоги: каталоги модуля удаляет UploadViewsTests
+        media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        chunks_dir = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        for path in (media_root, chunks_dir):
+            self.addCleanup(shutil.rmtree, path, ignore_errors=True)
+        temp_settings = self.settings(
+            MEDIA_ROOT=media_root, UPLOAD_CHUNKS_DIR=chunks_dir
+        )
+        temp_settings.enable()
+        self.addCleanup(temp_settings.disable)
+        self.user = User.objects.create_user(username='auth')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def upload(self, data):
+        state = self.client.post(
+            reverse('uploads:upload_create'),
+            {'filename': 'photo.png', 'size': len(data)}
+        ).json()
+        return self.client.patch(
+            reverse('uploads:upload_detail', args=[state['id']]),
+            data,
+            content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET='0',
+        ).json()
+
+    def test_delete_done_upload_removes_file(self):
+        state = self.upload(make_png(20, 10))
+        self.assertEqual(state['status'], Upload.DONE)
+        name = Upload.objects.get(pk=state['id']).image
+        self.assertTrue(default_storage.exists(name))
+        response = self.client.delete(
+            reverse('uploads:upload_detail', args=[state['id']])
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(default_storage.exists(name))
+
+    def test_attached_upload_keeps_file(self):
+        state = self.upload(make_png(20, 10))
+        self.client.post(
+            reverse('posts:post_create'),
+            {'text': 'Пост с загрузкой', 'upload': state['id']}
+        )
+        post = Post.objects.get(text='Пост с загрузкой')
+        self.assertFalse(Upload.objects.exists())
+        self.assertTrue(default_storage.exists(post.image.name))
@@ -0,0 +1,12 @@
+import io
+import os
+
+from PIL import Image
+
+
+def make_png(width, height):
+    buffer = io.BytesIO()
+    # шум почти не сжимается: файл заведомо больше одного куска
+    noise = os.urandom(width * height * 3)
+    Image.frombytes('RGB', (width, height), noise).save(buffer, 'PNG')
+    return buffer.getvalue()
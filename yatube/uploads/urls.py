@@ -0,0 +1,11 @@
+from django.urls import path
+
+from . import views
+
+
+app_name = 'uploads'
+
+urlpatterns = [
+    path('', views.upload_create, name='upload_create'),
+    path('<uuid:upload_id>/', views.upload_detail, name='upload_detail'),
+]
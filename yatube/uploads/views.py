@@ -0,0 +1,217 @@
+import os
+import shutil
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_http_methods, require_POST
+
+from core.imaging import JobTimeout, POOL_BUSY_ERRORS, image_pool
+from posts.images import InvalidImage, image_name, prepare_image
+from posts.models import Post
+from posts.signals import delete_unreferenced_file
+from .models import Upload
+
+READ_BLOCK_SIZE = 64 * 1024
+RETRY_AFTER = 5
+
+
+def upload_state(upload, status=200):
+    return JsonResponse({
+        'id': upload.pk,
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.offset,
+        'status': upload.status,
+        'error': upload.error,
+        'chunk_size': settings.UPLOAD_CHUNK_SIZE,
+    }, status=status)
+
+
+def upload_error(message, status, upload=None):
+    data = {'error': message}
+    if upload is not None:
+        data['offset'] = upload.offset
+    return JsonResponse(data, status=status)
+
+
+def finish_upload(upload):
+    """Собранный файл проверяется и уменьшается один раз, здесь, в пуле
+    картинок, вне транзакции. Если пул занят, исключение уходит наверх,
+    а куски остаются до повторной попытки.
+
+    Результат записывается, только если загрузку тем временем не
+    завершил параллельный запрос и не удалил пользователь; возвращается
+    загрузка в том виде, в каком она сохранена.
+    """
+    try:
+        processed = image_pool.run(prepare_image, upload.chunks_path)
+    except (InvalidImage, JobTimeout) as error:
+        upload.status = Upload.FAILED
+        upload.error = str(error)
+    else:
+        storage = Post._meta.get_field('image').storage
+        upload.image = storage.save(
+            image_name(upload.filename, processed.extension),
+            ContentFile(processed.data)
+        )
+        upload.width = processed.width
+        upload.height = processed.height
+        upload.placeholder = processed.placeholder
+        upload.status = Upload.DONE
+    fields = ('status', 'error', 'image', 'width', 'height', 'placeholder')
+    updated = Upload.objects.filter(
+        pk=upload.pk, status=Upload.PENDING
+    ).update(**{field: getattr(upload, field) for field in fields})
+    upload.remove_chunks()
+    if updated:
+        return upload
+    if upload.image:
+        delete_unreferenced_file(upload.image)
+    return get_object_or_404(Upload, pk=upload.pk)
+
+
+@login_required
+@require_POST
+def upload_create(request):
+    """Начинает загрузку: клиент сообщает имя и размер файла."""
+    filename = os.path.basename(request.POST.get('filename', '').strip())
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        size = 0
+    if not filename or size <= 0:
+        return upload_error('Нужны имя и размер файла', 400)
+    if size > settings.UPLOAD_MAX_SIZE:
+        return upload_error('Файл слишком большой', 413)
+    upload = Upload.objects.create(
+        user=request.user, filename=filename[:255], size=size
+    )
+    os.makedirs(settings.UPLOAD_CHUNKS_DIR, exist_ok=True)
+    open(upload.chunks_path, 'wb').close()
+    return upload_state(upload, status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'HEAD', 'PATCH', 'DELETE'])
+def upload_detail(request, upload_id):
+    """GET — сколько уже получено, PATCH — очередной кусок, DELETE —
+    отменить загрузку."""
+    if request.method == 'PATCH':
+        return append_chunk(request, upload_id)
+    upload = get_object_or_404(Upload, pk=upload_id, user=request.user)
+    if request.method == 'DELETE':
+        # готовый файл освобождает сигнал post_delete
+        upload.remove_chunks()
+        upload.delete()
+        return HttpResponse(status=204)
+    return upload_state(upload)
+
+
+def check_chunk(request, upload):
+    """Ответ с ошибкой, если кусок нельзя дописать, иначе None."""
+    if upload.status != Upload.PENDING:
+        return upload_error('Загрузка уже завершена', 409, upload)
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return upload_error('Нужен заголовок Upload-Offset', 400)
+    try:
+        stored = os.path.getsize(upload.chunks_path)
+    except FileNotFoundError:
+        stored = 0
+    if stored < upload.offset:
+        # временный файл потерян: начинаем с того, что реально есть
+        Upload.objects.filter(pk=upload.pk, offset=upload.offset).update(
+            offset=stored
+        )
+        upload.offset = stored
+    if offset != upload.offset:
+        return upload_error('Неверное смещение', 409, upload)
+    if not length and offset != upload.size:
+        # пустой PATCH в конце файла — повтор обработки после 503
+        return upload_error('Пустой кусок', 400, upload)
+    if (length > settings.UPLOAD_CHUNK_SIZE
+            or offset + length > upload.size):
+        return upload_error('Кусок слишком большой', 413, upload)
+    return None
+
+
+def write_chunk(request, upload, length):
+    """Пишет тело запроса блоками в отдельный файл куска; возвращает его
+    путь или None, если соединение оборвалось."""
+    os.makedirs(settings.UPLOAD_CHUNKS_DIR, exist_ok=True)
+    path = f'{upload.chunks_path}.{uuid.uuid4().hex}'
+    with open(path, 'wb') as chunk:
+        remaining = length
+        while remaining:
+            block = request.read(min(READ_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            chunk.write(block)
+            remaining -= len(block)
+    if remaining:
+        os.remove(path)
+        return None
+    return path
+
+
+@transaction.atomic
+def commit_chunk(upload, chunk_path):
+    """Дописывает принятый кусок к временному файлу загрузки; ответ с
+    409, если смещение изменилось, пока кусок шёл по сети, иначе None."""
+    locked = get_object_or_404(
+        Upload.objects.select_for_update(), pk=upload.pk
+    )
+    if locked.status != Upload.PENDING or locked.offset != upload.offset:
+        return upload_error('Неверное смещение', 409, locked)
+    with open(locked.chunks_path, 'a+b') as chunks:
+        # хвост оборванной записи отбрасывается
+        chunks.truncate(locked.offset)
+        with open(chunk_path, 'rb') as chunk:
+            shutil.copyfileobj(chunk, chunks)
+        upload.offset = chunks.tell()
+    Upload.objects.filter(pk=upload.pk).update(offset=upload.offset)
+    return None
+
+
+def append_chunk(request, upload_id):
+    """Дописывает тело запроса к временному файлу с места Upload-Offset.
+
+    Кусок читается из сокета блоками в отдельный файл, в памяти он
+    целиком не держится. Ни чтение из сети, ни обработка картинки не
+    держат транзакцию: строка загрузки блокируется, только пока
+    проверяется смещение и кусок дописывается к остальным. Смещение, не
+    совпавшее с полученным, отклоняется с 409 — клиент продолжает с
+    offset из ответа.
+    """
+    upload = get_object_or_404(Upload, pk=upload_id, user=request.user)
+    error = check_chunk(request, upload)
+    if error is not None:
+        return error
+    length = int(request.META.get('CONTENT_LENGTH') or 0)
+    if length:
+        chunk_path = write_chunk(request, upload, length)
+        if chunk_path is None:
+            return upload_error('Кусок получен не полностью', 400, upload)
+        try:
+            error = commit_chunk(upload, chunk_path)
+        finally:
+            os.remove(chunk_path)
+        if error is not None:
+            return error
+    if upload.offset == upload.size:
+        try:
+            upload = finish_upload(upload)
+        except POOL_BUSY_ERRORS:
+            response = upload_error(
+                'Обработка картинок перегружена, повторите позже', 503, upload
+            )
+            response['Retry-After'] = RETRY_AFTER
+            return response
+    return upload_state(upload)
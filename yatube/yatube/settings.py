@@ -1,4 +1,6 @@
 import os
+import sys
+import tempfile
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -18,6 +20,8 @@ INSTALLED_APPS = [
     'core.apps.CoreConfig',
     'users.apps.UsersConfig',
     'posts.apps.PostsConfig',
+    'uploads.apps.UploadsConfig',
+    'api.apps.ApiConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -35,6 +39,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.PersonalFragmentsMiddleware',
+    'posts.middleware.PageCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -106,9 +112,79 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# кто отдаёт байты файла: 'django' (FileResponse), 'accel' (nginx,
+# X-Accel-Redirect) или 'sendfile' (X-Sendfile)
+MEDIA_SERVE_BACKEND = os.getenv('YATUBE_MEDIA_BACKEND', 'django')
+# internal location в nginx, который смотрит в MEDIA_ROOT
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+MEDIA_PUBLIC_DIRS = ('posts', 'cache')
+# для файлов, которые могут смениться под тем же именем
+MEDIA_MAX_AGE = 60 * 60
+
+THUMBNAIL_BACKEND = 'posts.thumbnails.ThumbnailBackend'
+
+# все варианты миниатюр Post.image: создаются заранее, при загрузке
+POST_THUMBNAILS = {
+    'card': ('960x480', {'crop': 'center', 'upscale': False}),
+    'detail': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+# ширины для srcset; каждый вариант режется до своей ширины включительно
+POST_THUMBNAIL_WIDTHS = (320, 480, 640)
+# от лучшего к запасному; WebP пропускается, если Pillow собран без него
+POST_THUMBNAIL_FORMATS = ('WEBP', 'JPEG')
+
+# тесты не должны видеть общий кэш, оставшийся от прошлых запусков
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+
+CACHE_DIR = os.getenv(
+    'YATUBE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'yatube-cache')
+)
 
 CACHES = {
     'default': {
+        'BACKEND': 'core.cache.TwoTierCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 60,
+            'JOURNAL': (
+                None if TESTING
+                else os.path.join(CACHE_DIR, 'invalidations.log')
+            ),
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(CACHE_DIR, 'shared'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+}
+
+if TESTING:
+    CACHES['shared'] = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
-}
+
+# пул процессов для Pillow, см. core.imaging; 0 - работать сразу, в
+# процессе веб-воркера
+IMAGE_WORKERS = 0 if TESTING else 2
+IMAGE_QUEUE_LIMIT = 100
+IMAGE_JOB_TIMEOUT = 60
+
+# картинки больше этого по большей стороне уменьшаются при сохранении
+POST_IMAGE_MAX_SIDE = 2048
+POST_IMAGE_QUALITY = 85
+# сторона превью, которое показывается до загрузки миниатюры
+POST_PLACEHOLDER_SIDE = 20
+
+# докачиваемая загрузка картинок кусками, см. uploads
+UPLOAD_CHUNKS_DIR = os.getenv(
+    'YATUBE_UPLOAD_DIR', os.path.join(tempfile.gettempdir(), 'yatube-uploads')
+)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+# незавершённые и не прикреплённые к посту загрузки старше этого (в
+# секундах) удаляет команда clean_uploads
+UPLOAD_EXPIRY = 60 * 60 * 24
@@ -1,20 +1,25 @@
 from django.contrib import admin
 from django.urls import include, path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from core.views import cache_stats, image_stats, serve_media
 
 handler404 = 'core.views.page_not_found'
 handler403 = 'core.views.csrf_failure'
 
 urlpatterns = [
+    path('admin/cache-stats/', cache_stats, name='cache_stats'),
+    path('admin/image-stats/', image_stats, name='image_stats'),
     path('admin/', admin.site.urls),
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    path('uploads/', include('uploads.urls', namespace='uploads')),
+    path('api/v1/', include('api.urls', namespace='api')),
+    path(
+        settings.MEDIA_URL.lstrip('/') + '<path:path>',
+        serve_media,
+        name='media'
+    ),
     path('', include('posts.urls', namespace='posts'))
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
-    )